@@ -0,0 +1,327 @@
+__author__ = "8030456, Schuppan, 8404886, Kraus"
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import re
+
+from util import Util
+
+# Invoices are separated by their first line, see cmd_invoice.
+BOUNDARY = b"\nTime: "
+ORDER_RE = re.compile(r" (\d+)\. (.*) \+([\d.,]+) EUR")
+REQUEST_RE = re.compile(r"  \+ (.*) \(([\d.,]+) EUR\)")
+RESCIND_RE = re.compile(r" (\d+)\. Rescind order no\. (\d+) -([\d.,]+) EUR")
+TOTAL_RE = re.compile(r"Total: (-?)([\d.,]+) EUR")
+
+
+def cents(val: str) -> int:
+    """Parses an amount of the invoices file into cents. Invoices
+    written before amounts were exact may have float noise."""
+    try:
+        return Util.parse_cents(val)
+    except ValueError:
+        return round(float(val.replace(",", ".")) * 100)
+
+
+class Totals:
+    """Revenue in cents per food item, table and hour of the day,
+    plus overall figures. Totals of several chunks can be merged."""
+
+    def __init__(self) -> None:
+        self.invoices = 0
+        self.revenue = 0
+        self.specials = 0
+        # Invoices whose orders don't add up to their total.
+        self.mismatches = 0
+        self.items: dict[str, int] = {}
+        self.tables: dict[str, int] = {}
+        self.hours: dict[str, int] = {}
+
+    def add_invoice(self, lines: list[str]) -> None:
+        """Adds an invoice given as its lines without line breaks.
+
+        >>> totals = Totals()
+        >>> totals.add_invoice([
+        ...     "Time: 2024-05-01 19:30:00",
+        ...     "Table: 1",
+        ...     "Orders:",
+        ...     " 1. Pizza +8.50 EUR",
+        ...     "  + extra cheese (1.00 EUR)",
+        ...     " 2. Water +2.00 EUR",
+        ...     " 3. Rescind order no. 1 -9.50 EUR",
+        ...     "Total: 2.00 EUR",
+        ... ])
+        >>> totals.revenue, totals.specials, totals.mismatches
+        (200, 0, 0)
+        >>> totals.items
+        {'Pizza': 0, 'Water': 200}
+        """
+        time = lines[0].removeprefix("Time: ")
+        table = lines[1].removeprefix("Table: ")
+        hour = time[11:13]
+        # Food item and amount of each order by order number.
+        orders: dict[int, tuple[str, int]] = {}
+        # Charges for special requests by order number.
+        specials: dict[int, int] = {}
+        invoice_total = 0
+        for line in lines[3:]:
+            if m := RESCIND_RE.fullmatch(line):
+                number = int(m[2])
+                name, amount = orders.get(number, ("?", cents(m[3])))
+                self.items[name] = self.items.get(name, 0) - amount
+                self.specials -= specials.get(number, 0)
+                invoice_total -= amount
+            elif m := ORDER_RE.fullmatch(line):
+                amount = cents(m[3])
+                orders[int(m[1])] = (m[2], amount)
+                self.items[m[2]] = self.items.get(m[2], 0) + amount
+                invoice_total += amount
+            elif m := REQUEST_RE.fullmatch(line):
+                # Special requests are charged to the order above.
+                charge = cents(m[2])
+                number = next(reversed(orders))
+                name, amount = orders[number]
+                orders[number] = (name, amount + charge)
+                self.items[name] = self.items.get(name, 0) + charge
+                specials[number] = specials.get(number, 0) + charge
+                self.specials += charge
+                invoice_total += charge
+            elif m := TOTAL_RE.fullmatch(line):
+                total = cents(m[2]) * (-1 if m[1] else 1)
+                if total != invoice_total:
+                    self.mismatches += 1
+        self.invoices += 1
+        self.revenue += invoice_total
+        self.tables[table] = self.tables.get(table, 0) + invoice_total
+        self.hours[hour] = self.hours.get(hour, 0) + invoice_total
+
+    def merge(self, other: "Totals") -> None:
+        """Adds the totals of other to these."""
+        self.invoices += other.invoices
+        self.revenue += other.revenue
+        self.specials += other.specials
+        self.mismatches += other.mismatches
+        for mine, theirs in [
+            (self.items, other.items),
+            (self.tables, other.tables),
+            (self.hours, other.hours),
+        ]:
+            for key, amount in theirs.items():
+                mine[key] = mine.get(key, 0) + amount
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+    @staticmethod
+    def from_dict(d: dict) -> "Totals":
+        totals = Totals()
+        vars(totals).update(d)
+        return totals
+
+
+def parse_chunk(filename: str, start: int, end: int) -> tuple[Totals, int]:
+    """Parses the invoices in the byte range [start, end), which must
+    begin at an invoice. Returns their totals and the offset right
+    after the last complete invoice, as the last one may still be
+    being written."""
+    with open(filename, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    totals = Totals()
+    done = start
+    pos = 0
+    while pos < len(data):
+        next_pos = data.find(BOUNDARY, pos)
+        next_pos = len(data) if next_pos == -1 else next_pos + 1
+        lines = data[pos:next_pos].decode().splitlines()
+        while len(lines) > 0 and lines[-1] == "":
+            lines.pop()
+        # Complete invoices end in their total.
+        if len(lines) >= 3 and lines[-1].startswith("Total: "):
+            totals.add_invoice(lines)
+            done = start + next_pos
+        pos = next_pos
+    return totals, done
+
+
+def split(filename: str, start: int, end: int, chunk_size: int) -> list[int]:
+    """Returns the offsets splitting [start, end) into chunks of about
+    chunk_size bytes, each beginning at an invoice."""
+    block_size = 1 << 16
+    offsets = [start]
+    with open(filename, "rb") as f:
+        while offsets[-1] + chunk_size < end:
+            pos = offsets[-1] + max(chunk_size, 1) - 1
+            while pos < end:
+                f.seek(pos)
+                # Overlap the blocks so no boundary is cut in two.
+                i = f.read(block_size + len(BOUNDARY) - 1).find(BOUNDARY)
+                if i != -1:
+                    break
+                pos += block_size
+            if pos >= end or pos + i + 1 >= end:
+                break
+            offsets.append(pos + i + 1)
+    return offsets
+
+
+def analyze(
+    filename: str,
+    start: int = 0,
+    workers: int | None = None,
+    chunk_size: int = 1 << 26,
+) -> tuple[Totals, int]:
+    """Parses the invoices file from offset start in parallel chunks.
+    Returns the totals and the offset to continue from next time."""
+    end = os.path.getsize(filename)
+    offsets = split(filename, start, end, chunk_size)
+    ranges = list(zip(offsets, offsets[1:] + [end]))
+    totals = Totals()
+    done = start
+    if len(ranges) == 1:
+        res = [parse_chunk(filename, *ranges[0])]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            res = list(
+                pool.map(
+                    parse_chunk,
+                    [filename] * len(ranges),
+                    *zip(*ranges),
+                )
+            )
+    for chunk_totals, chunk_done in res:
+        totals.merge(chunk_totals)
+        done = max(done, chunk_done)
+    return totals, done
+
+
+def load_state(filename: str, invoices: str) -> tuple[Totals, int]:
+    """Returns the totals and offset of a previous run on the same
+    invoices file, or empty totals if there was none or the file was
+    replaced or truncated since."""
+    try:
+        with open(filename, "r") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return Totals(), 0
+    st = os.stat(invoices)
+    if state["inode"] != st.st_ino or state["offset"] > st.st_size:
+        print(f"{invoices} was replaced, starting over.")
+        return Totals(), 0
+    return Totals.from_dict(state["totals"]), state["offset"]
+
+
+def save_state(filename: str, invoices: str, totals: Totals, offset: int):
+    """Saves totals and offset for the next incremental run."""
+    state = {
+        "inode": os.stat(invoices).st_ino,
+        "offset": offset,
+        "totals": totals.to_dict(),
+    }
+    tmp = filename + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, filename)
+
+
+def report(totals: Totals, menu: str) -> dict:
+    """Groups the totals by food item, type, category, table and hour.
+    Items sold in several categories count in each of them. Items no
+    longer on the menu have type and category "?"."""
+    from main import FoodItems
+
+    food_items = {item.name: item for item in FoodItems(menu)}
+    types: dict[str, int] = {}
+    categories: dict[str, int] = {}
+    for name, amount in totals.items.items():
+        item = food_items.get(name)
+        item_type = "?" if item is None else item.type
+        types[item_type] = types.get(item_type, 0) + amount
+        for cat in ["?"] if item is None else sorted(item.categories):
+            categories[cat] = categories.get(cat, 0) + amount
+    return {
+        "invoices": totals.invoices,
+        "revenue": totals.revenue,
+        "special_requests": totals.specials,
+        "mismatches": totals.mismatches,
+        "item": totals.items,
+        "type": types,
+        "category": categories,
+        "table": totals.tables,
+        "hour": totals.hours,
+    }
+
+
+def print_report(res: dict) -> None:
+    """Prints a report by revenue, highest first."""
+    print(f"Invoices: {res['invoices']}")
+    print(f"Revenue: {Util.format_cents(res['revenue'])} EUR")
+    print(
+        f"Special requests: {Util.format_cents(res['special_requests'])} EUR"
+    )
+    if res["mismatches"] > 0:
+        print(f"Invoices not adding up to their total: {res['mismatches']}")
+    for group in ["item", "type", "category", "table", "hour"]:
+        print()
+        print(f"Revenue per {group}:")
+        if group == "hour":
+            rows = sorted(res[group].items())
+        else:
+            rows = sorted(res[group].items(), key=lambda r: (-r[1], r[0]))
+        print(
+            Util.column_align(
+                [
+                    [f"  {key}", f"{Util.format_cents(amount)} EUR"]
+                    for key, amount in rows
+                ],
+                sep="  ",
+            )
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Revenue report over the invoices file"
+    )
+    parser.add_argument("invoices", nargs="?", default="invoices.txt")
+    parser.add_argument("--menu", default="food.csv")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="worker processes (default: one per core)",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=64,
+        metavar="MB",
+        help="bytes handed to a worker at once",
+    )
+    parser.add_argument(
+        "--state",
+        metavar="FILE",
+        help="keep totals in FILE and only parse new invoices next time",
+    )
+    parser.add_argument(
+        "--json",
+        metavar="FILE",
+        help="write the report as JSON to FILE",
+    )
+    args = parser.parse_args()
+
+    totals, start = Totals(), 0
+    if args.state is not None:
+        totals, start = load_state(args.state, args.invoices)
+    new, offset = analyze(
+        args.invoices, start, args.workers, args.chunk_size << 20
+    )
+    totals.merge(new)
+    if args.state is not None:
+        save_state(args.state, args.invoices, totals, offset)
+    res = report(totals, args.menu)
+    print_report(res)
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(res, f, indent=1)
@@ -0,0 +1,382 @@
+__author__ = "8030456, Schuppan, 8404886, Kraus"
+
+import argparse
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+import hashlib
+import mmap
+import os
+import struct
+
+from invoices import Invoice, InvoiceEntry, InvoiceSink
+from util import Util
+
+# The archive starts with MAGIC, followed by one record per invoice:
+# RECORD, table ID, then per entry ENTRY, its item name and per
+# special request SPECIAL and its text. Strings are UTF-8.
+MAGIC = b"RSA1"
+# Record length incl. header, time, total in cents, number of
+# entries, table ID length.
+RECORD = struct.Struct("<IdqIH")
+# Amount in cents, index of the rescinded order or -1, item name
+# length, number of special requests.
+ENTRY = struct.Struct("<qiHH")
+# Charge in cents, request length.
+SPECIAL = struct.Struct("<qH")
+
+# archive.idx holds one TIME_KEY per record, in order of the archive.
+# Time (never decreasing), table hash, record offset.
+TIME_KEY = struct.Struct("<dQQ")
+# archive.tbl starts with the number of entries sorted by table hash,
+# followed by TABLE_KEYs, the unsorted ones appended since at the end.
+SORTED = struct.Struct("<Q")
+TABLE_KEY = struct.Struct("<QQ")
+
+
+def table_hash(table_id: str) -> int:
+    """Returns a 64 bit hash of a table ID, stable across runs."""
+    digest = hashlib.blake2b(table_id.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def encode(invoice: Invoice) -> bytes:
+    """Encodes an invoice into an archive record."""
+    parts = []
+    table_id = invoice.table_id.encode()
+    parts.append(table_id)
+    for entry in invoice.entries:
+        name = entry.name.encode()
+        ref = -1 if entry.rescinded is None else entry.rescinded
+        parts.append(
+            ENTRY.pack(
+                entry.amount, ref, len(name), len(entry.special_requests)
+            )
+        )
+        parts.append(name)
+        for request, charge in entry.special_requests:
+            request = request.encode()
+            parts.append(SPECIAL.pack(charge, len(request)))
+            parts.append(request)
+    body = b"".join(parts)
+    return (
+        RECORD.pack(
+            RECORD.size + len(body),
+            invoice.time.timestamp(),
+            invoice.total,
+            len(invoice.entries),
+            len(table_id),
+        )
+        + body
+    )
+
+
+def decode(data, pos: int) -> Invoice:
+    """Decodes the archive record at offset pos of data."""
+    _, t, total, num_entries, n = RECORD.unpack_from(data, pos)
+    pos += RECORD.size
+    table_id = bytes(data[pos : pos + n]).decode()
+    pos += n
+    entries = []
+    for _ in range(num_entries):
+        amount, ref, n, num_requests = ENTRY.unpack_from(data, pos)
+        pos += ENTRY.size
+        name = bytes(data[pos : pos + n]).decode()
+        pos += n
+        special_requests = []
+        for _ in range(num_requests):
+            charge, n = SPECIAL.unpack_from(data, pos)
+            pos += SPECIAL.size
+            special_requests.append(
+                (bytes(data[pos : pos + n]).decode(), charge)
+            )
+            pos += n
+        entries.append(
+            InvoiceEntry(
+                name, amount, special_requests, None if ref == -1 else ref
+            )
+        )
+    time = datetime.fromtimestamp(t)
+    invoice = Invoice(time, table_id, "", total, entries)
+    invoice.text = render(invoice)
+    return invoice
+
+
+def render(invoice: Invoice) -> str:
+    """Renders an invoice's entries like cmd_invoice does."""
+    parts = [
+        f"Time: {invoice.time.strftime('%Y-%m-%d %H:%M:%S')}\n",
+        f"Table: {invoice.table_id}\n",
+        "Orders:\n",
+    ]
+    for i, entry in enumerate(invoice.entries):
+        if entry.rescinded is None:
+            amount = Util.format_cents(entry.amount)
+            parts.append(f" {i+1}. {entry.name} +{amount} EUR\n")
+            for request, charge in entry.special_requests:
+                parts.append(
+                    f"  + {request} ({Util.format_cents(charge)} EUR)\n"
+                )
+        else:
+            parts.append(
+                f" {i+1}. Rescind order no. {entry.rescinded+1} \
+{Util.format_cents(entry.amount)} EUR\n"
+            )
+    parts.append(f"Total: {Util.format_cents(invoice.total)} EUR\n")
+    return "".join(parts)
+
+
+def _paths(directory: str) -> tuple[str, str, str]:
+    return (
+        os.path.join(directory, "archive.bin"),
+        os.path.join(directory, "archive.idx"),
+        os.path.join(directory, "archive.tbl"),
+    )
+
+
+class ArchiveInvoiceSink(InvoiceSink):
+    """Appends invoices to a binary archive in a directory, indexed
+    by time and table, see InvoiceArchive for queries. Records torn
+    by a crash are cut off and missing index entries rebuilt when
+    the sink is opened. On close(), the table index is sorted."""
+
+    def __init__(self, directory: str, fsync: bool = False) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.__dir = directory
+        self.__fsync = fsync
+        archive, index, tables = _paths(directory)
+        for path in [archive, index, tables]:
+            if not os.path.exists(path):
+                open(path, "wb").close()
+        if os.path.getsize(archive) == 0:
+            with open(archive, "wb") as f:
+                f.write(MAGIC)
+        self.__archive = open(archive, "r+b")
+        self.__index = open(index, "r+b")
+        self.__tables = open(tables, "r+b")
+        if os.path.getsize(tables) < SORTED.size:
+            self.__tables.write(SORTED.pack(0))
+        self.__recover()
+
+    def __recover(self) -> None:
+        """Drops torn records and indexes records missing from the
+        indexes."""
+        index_size = os.path.getsize(self.__index.name)
+        index_size -= index_size % TIME_KEY.size
+        self.__index.truncate(index_size)
+        self.__index.seek(0, os.SEEK_END)
+        self.__last_time = float("-inf")
+        end = len(MAGIC)
+        if index_size > 0:
+            self.__index.seek(index_size - TIME_KEY.size)
+            self.__last_time, _, pos = TIME_KEY.unpack(
+                self.__index.read(TIME_KEY.size)
+            )
+            self.__archive.seek(pos)
+            (length,) = struct.unpack("<I", self.__archive.read(4))
+            end = pos + length
+        self.__archive.seek(end)
+        data = self.__archive.read()
+        pos = 0
+        while pos + RECORD.size <= len(data):
+            length, t, _, _, n = RECORD.unpack_from(data, pos)
+            if pos + length > len(data):
+                break
+            table_id = data[pos + RECORD.size : pos + RECORD.size + n]
+            self.__add_keys(t, table_hash(table_id.decode()), end + pos)
+            pos += length
+        self.__archive.truncate(end + pos)
+        self.__archive.seek(0, os.SEEK_END)
+        self.__sort_tables()
+        self.__flush()
+
+    def name(self) -> str:
+        return self.__dir
+
+    def write(self, invoice: Invoice) -> None:
+        self.write_many([invoice])
+
+    def write_many(self, invoices: list[Invoice]) -> None:
+        """Appends all invoices, then flushes (and syncs) once."""
+        records = [encode(invoice) for invoice in invoices]
+        offset = self.__archive.tell()
+        self.__archive.write(b"".join(records))
+        for invoice, record in zip(invoices, records):
+            self.__add_keys(
+                invoice.time.timestamp(), table_hash(invoice.table_id), offset
+            )
+            offset += len(record)
+        self.__flush()
+
+    def __add_keys(self, t: float, h: int, offset: int) -> None:
+        # Keep the time index sorted even if the clock went back, the
+        # record itself has the real time.
+        self.__last_time = max(self.__last_time, t)
+        self.__index.seek(0, os.SEEK_END)
+        self.__index.write(TIME_KEY.pack(self.__last_time, h, offset))
+        self.__tables.seek(0, os.SEEK_END)
+        self.__tables.write(TABLE_KEY.pack(h, offset))
+
+    def __flush(self) -> None:
+        for f in [self.__archive, self.__index, self.__tables]:
+            f.flush()
+            if self.__fsync:
+                os.fsync(f.fileno())
+
+    def __sort_tables(self) -> None:
+        """Rewrites the table index sorted, from the time index."""
+        self.__index.seek(0)
+        data = self.__index.read()
+        keys = sorted(
+            (h, offset) for _, h, offset in TIME_KEY.iter_unpack(data)
+        )
+        self.__tables.seek(0)
+        self.__tables.write(SORTED.pack(len(keys)))
+        self.__tables.write(b"".join(TABLE_KEY.pack(*k) for k in keys))
+        self.__tables.truncate()
+
+    def close(self) -> None:
+        self.__sort_tables()
+        self.__flush()
+        for f in [self.__archive, self.__index, self.__tables]:
+            f.close()
+
+
+class _Column:
+    """Read-only sequence of one field of fixed-size keys in a
+    memory map, for bisect."""
+
+    def __init__(self, data, key: struct.Struct, field: int, start, n):
+        self.__data = data
+        self.__key = key
+        self.__field = field
+        self.__start = start
+        self.__n = n
+
+    def __len__(self) -> int:
+        return self.__n
+
+    def __getitem__(self, i: int):
+        return self.__key.unpack_from(
+            self.__data, self.__start + i * self.__key.size
+        )[self.__field]
+
+
+class InvoiceArchive:
+    """Read-only view of an invoice archive written by
+    ArchiveInvoiceSink. Files are memory-mapped, so queries only read
+    the index entries and records they need. Invoices archived after
+    opening are not visible."""
+
+    def __init__(self, directory: str) -> None:
+        self.__files = []
+        archive, index, tables = _paths(directory)
+        self.__archive = self.__map(archive)
+        self.__index = self.__map(index)
+        self.__tables = self.__map(tables)
+        self.__times = _Column(
+            self.__index,
+            TIME_KEY,
+            0,
+            0,
+            len(self.__index) // TIME_KEY.size,
+        )
+        num_tables = (len(self.__tables) - SORTED.size) // TABLE_KEY.size
+        num_sorted = 0
+        if num_tables > 0:
+            (num_sorted,) = SORTED.unpack_from(self.__tables)
+        self.__sorted_hashes = _Column(
+            self.__tables, TABLE_KEY, 0, SORTED.size, num_sorted
+        )
+        self.__num_tables = num_tables
+
+    def __map(self, path: str):
+        f = open(path, "rb")
+        self.__files.append(f)
+        if os.path.getsize(path) == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self.__times)
+
+    def __getitem__(self, i: int) -> Invoice:
+        """Returns the i-th archived invoice."""
+        _, _, offset = TIME_KEY.unpack_from(self.__index, i * TIME_KEY.size)
+        return decode(self.__archive, offset)
+
+    def between(
+        self, start: datetime | None, end: datetime | None
+    ) -> list[Invoice]:
+        """Returns the invoices with start <= time < end, in order.
+        None means no limit."""
+        lo, hi = 0, len(self)
+        if start is not None:
+            lo = bisect_left(self.__times, start.timestamp())
+        if end is not None:
+            hi = bisect_left(self.__times, end.timestamp())
+        res = [self[i] for i in range(lo, hi)]
+        if start is not None:
+            # Only drops invoices if the clock went back meanwhile.
+            res = [inv for inv in res if inv.time >= start]
+        return res
+
+    def for_table(self, table_id: str) -> list[Invoice]:
+        """Returns the invoices of a table, in order."""
+        h = table_hash(table_id)
+        lo = bisect_left(self.__sorted_hashes, h)
+        hi = bisect_right(self.__sorted_hashes, h)
+        offsets = [
+            TABLE_KEY.unpack_from(
+                self.__tables, SORTED.size + i * TABLE_KEY.size
+            )[1]
+            for i in range(lo, hi)
+        ]
+        for i in range(len(self.__sorted_hashes), self.__num_tables):
+            key_h, offset = TABLE_KEY.unpack_from(
+                self.__tables, SORTED.size + i * TABLE_KEY.size
+            )
+            if key_h == h:
+                offsets.append(offset)
+        res = [decode(self.__archive, offset) for offset in sorted(offsets)]
+        # Different tables may share a hash.
+        return [inv for inv in res if inv.table_id == table_id]
+
+    def close(self) -> None:
+        for m in [self.__archive, self.__index, self.__tables]:
+            if isinstance(m, mmap.mmap):
+                m.close()
+        for f in self.__files:
+            f.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Query an invoice archive, printing the invoices"
+    )
+    parser.add_argument("directory")
+    parser.add_argument("--table", help="only invoices of this table")
+    parser.add_argument(
+        "--since",
+        type=datetime.fromisoformat,
+        metavar="TIME",
+        help='only invoices at or after TIME, e.g. "2024-01-31 12:00"',
+    )
+    parser.add_argument(
+        "--until",
+        type=datetime.fromisoformat,
+        metavar="TIME",
+        help="only invoices before TIME",
+    )
+    args = parser.parse_args()
+    archive = InvoiceArchive(args.directory)
+    if args.table is not None:
+        invoices = archive.for_table(args.table)
+        if args.since is not None:
+            invoices = [inv for inv in invoices if inv.time >= args.since]
+        if args.until is not None:
+            invoices = [inv for inv in invoices if inv.time < args.until]
+    else:
+        invoices = archive.between(args.since, args.until)
+    for invoice in invoices:
+        print(invoice.text)
+    archive.close()
@@ -0,0 +1,417 @@
+__author__ = "8030456, Schuppan, 8404886, Kraus"
+
+import argparse
+import contextlib
+from dataclasses import dataclass
+from datetime import datetime
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from invoices import FileInvoiceSink
+from main import (
+    FoodItems,
+    Order,
+    OrderLog,
+    Rescindment,
+    SpecialRequest,
+    Table,
+    create_app,
+)
+from sharedmenu import publish
+import shell
+from stats import Stats
+from util import Util
+
+
+def write_menu(filename: str, rows: int, seed: int = 0) -> None:
+    """Writes a synthetic food.csv with the given number of rows."""
+    rng = random.Random(seed)
+    types = ["main", "drink", "side", "dessert"]
+    categories = ["vegan", "veggie", "beef", "pork", "hot", "alcohol-free"]
+    words = ["Burger", "Pizza", "Cola", "Eistee", "Salad", "Wrap", "Beer"]
+    with open(filename, "w") as f:
+        f.write("name;type;category;price\n")
+        for i in range(rows):
+            cats = ", ".join(rng.sample(categories, rng.randint(1, 2)))
+            price = f"{rng.randint(1, 40)},{rng.choice(['0', '5', '99'])}"
+            name = f"{rng.choice(words)}-{i}"
+            f.write(f"{name};{rng.choice(types)};{cats};{price}\n")
+
+
+def make_orders(food_items: FoodItems, n: int, seed: int = 0):
+    """Yields n synthetic orders, every 10th with a special request."""
+    rng = random.Random(seed)
+    for i in range(n):
+        special_requests = []
+        if i % 10 == 0:
+            special_requests.append(SpecialRequest("no onions", 100))
+        yield Order(
+            datetime.now(),
+            food_items[rng.randrange(len(food_items))],
+            special_requests,
+        )
+
+
+def make_tables(
+    food_items: FoodItems, tables: int, orders: int, seed: int = 0
+) -> list[Table]:
+    """Returns synthetic tables with the given number of orders each,
+    every 20th order is rescinded."""
+    res = []
+    for t in range(tables):
+        table = Table(f"t{t}")
+        for i, order in enumerate(make_orders(food_items, orders, seed + t)):
+            table.append(order)
+            if i % 20 == 19:
+                pos = len(table.orders) - 1
+                table.append(
+                    Rescindment(datetime.now(), pos, table.orders.amount(pos))
+                )
+        res.append(table)
+    return res
+
+
+def timed(fn, repeat: int = 3) -> float:
+    """Returns the fastest of repeat runs of fn in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_memory(fn) -> int:
+    """Returns the peak memory allocated while running fn in bytes."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def result(name: str, params: dict, seconds: float, **extra) -> dict:
+    """Builds a benchmark result and prints it."""
+    res = {"name": name, "params": params, "seconds": seconds, **extra}
+    desc = " ".join(f"{k}={v}" for k, v in params.items())
+    more = "".join(f", {k} {v}" for k, v in extra.items())
+    print(f"{name} {desc}: {seconds * 1000:.3f} ms{more}")
+    return res
+
+
+@dataclass
+class BaselineFoodItem:
+    """FoodItem as it was before the compact layout."""
+
+    name: str
+    type: str
+    categories: set[str]
+    price: int  # In cents.
+
+
+def load_baseline(filename: str) -> list[BaselineFoodItem]:
+    """Copy of the original menu loader, the reference for bench_load:
+    float prices and one dataclass instance per row."""
+    items = []
+    with open(filename, "r") as file:
+        for i, line in enumerate(file):
+            if i == 0 or line == "":
+                continue
+            cols = line.removesuffix("\n").split(";")
+            if len(cols) != 4:
+                raise Exception(
+                    f"line {i}: expected semicolon- separated \
+CSV with 4 columns (name, type, category, price)"
+                )
+            categories = set(s.strip() for s in cols[2].split(","))
+            price = 0.0
+            try:
+                price = float(cols[3].replace(",", ".")) * 100
+            except ValueError:
+                raise Exception(
+                    f"line {i}: expected price \
+(3rd column) to be a floating-point number"
+                )
+            # The original rejected price % 1 != 0 here, which float
+            # noise makes it do for prices like "1,99" in write_menu's
+            # menus. Rounding costs the same and lets it load them.
+            price = round(price)
+            items.append(BaselineFoodItem(cols[0], cols[1], categories, price))
+    return items
+
+
+def bench_load(filename: str, rows: int) -> list[dict]:
+    """Load time and peak memory of the original loader, of both
+    FoodItems layouts, and of attaching to the menu in shared
+    memory."""
+    res = [
+        result(
+            "load",
+            {"rows": rows, "baseline": True},
+            timed(lambda: load_baseline(filename), repeat=1),
+            peak_bytes=peak_memory(lambda: load_baseline(filename)),
+        )
+    ]
+    for compact in [False, True]:
+        res.append(
+            result(
+                "load",
+                {"rows": rows, "compact": compact},
+                timed(lambda: FoodItems(filename, compact), repeat=1),
+                peak_bytes=peak_memory(lambda: FoodItems(filename, compact)),
+            )
+        )
+    menu = publish(FoodItems(filename, compact=True))
+    try:
+        res.append(
+            result(
+                "load",
+                {"rows": rows, "shared": True},
+                timed(lambda: FoodItems.attach(menu.name)),
+                peak_bytes=peak_memory(lambda: FoodItems.attach(menu.name)),
+            )
+        )
+    finally:
+        menu.unlink()
+    return res
+
+
+def bench_startup(filename: str, rows: int) -> list[dict]:
+    """Menu load and full startup of main.py in batch mode without
+    (cold) and with (warm) a valid menu cache."""
+    cache = filename + ".cache"
+    here = os.path.dirname(os.path.abspath(__file__))
+    main_py = os.path.join(here, "main.py")
+    with tempfile.TemporaryDirectory() as d:
+        shutil.copy(filename, os.path.join(d, "food.csv"))
+
+        def start() -> None:
+            subprocess.run(
+                [sys.executable, main_py, "--batch", os.devnull],
+                cwd=d,
+                check=True,
+                capture_output=True,
+            )
+
+        def clear() -> None:
+            for path in [cache, os.path.join(d, "food.csv.cache")]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+        res = []
+        for state in ["cold", "warm"]:
+
+            def load() -> None:
+                if state == "cold":
+                    clear()
+                FoodItems(filename, cache=True)
+
+            def run_main() -> None:
+                if state == "cold":
+                    clear()
+                start()
+
+            # The first warm run writes the cache, timed() takes the
+            # fastest run.
+            res.append(
+                result(
+                    "menu_load",
+                    {"rows": rows, "cache": state},
+                    timed(load),
+                )
+            )
+            res.append(
+                result(
+                    "startup",
+                    {"rows": rows, "cache": state},
+                    timed(run_main),
+                )
+            )
+        clear()
+    return res
+
+
+def bench_list(filename: str, rows: int) -> list[dict]:
+    """Menu search alone and the full list command incl. output."""
+    app = create_app(filename, invoice_sink=FileInvoiceSink(os.devnull))
+    res = [
+        result(
+            "search_index",
+            {"rows": rows},
+            timed(lambda: app.food_items.search("x"), repeat=1),
+        )
+    ]
+    for query in ["burger", "type:drink price<5", "pizza-1"]:
+        res.append(
+            result(
+                "search",
+                {"rows": rows, "query": query},
+                timed(lambda: app.food_items.search(query)),
+            )
+        )
+        with contextlib.redirect_stdout(io.StringIO()):
+            seconds = timed(lambda: app.execute(f"list {query}"))
+        res.append(result("cmd_list", {"rows": rows, "query": query}, seconds))
+    app.close()
+    return res
+
+
+def bench_column_align(rows: int) -> list[dict]:
+    """Column-aligning a listing-like table."""
+    cells = [
+        [f" {i}.", f"Item-{i}", "main", "vegan,hot", f"{i % 40}.5 EUR"]
+        for i in range(rows)
+    ]
+    return [
+        result(
+            "column_align",
+            {"rows": rows},
+            timed(lambda: Util.column_align(cells, sep="  ")),
+        )
+    ]
+
+
+def bench_tables(food_items: FoodItems, orders: int) -> list[dict]:
+    """Rendering and totals of a table with many orders."""
+    (table,) = make_tables(food_items, 1, orders)
+    return [
+        result(
+            "format_orders",
+            {"orders": orders},
+            timed(table.format_orders),
+        ),
+        result(
+            "table_amount",
+            {"orders": orders},
+            timed(lambda: [table.amount() for _ in range(1000)]) / 1000,
+        ),
+        result(
+            "table_check_totals",
+            {"orders": orders},
+            timed(table.check_totals),
+        ),
+    ]
+
+
+def bench_orders(food_items: FoodItems, n: int) -> list[dict]:
+    """Memory per order of a list of Order objects and an OrderLog."""
+    res = []
+    for name, container in [("list", list), ("OrderLog", OrderLog)]:
+
+        def build():
+            container(make_orders(food_items, n))
+
+        res.append(
+            result(
+                "order_memory",
+                {"orders": n, "container": name},
+                timed(build, repeat=1),
+                bytes_per_order=round(peak_memory(build) / n),
+            )
+        )
+    return res
+
+
+def bench_dispatch(n: int, stats: bool = False) -> list[dict]:
+    """Time Shell.execute takes to look up, check and parse a command
+    line, using a command that does nothing. With stats set, commands
+    are instrumented."""
+    sh = shell.Shell()
+    if stats:
+        sh.enable_stats(Stats())
+    for name in ["noop", "noops", "other", "order", "orders"]:
+        sh.add_command(
+            shell.Command(
+                name,
+                "does nothing",
+                [
+                    shell.IntParam("a", min=0, max=100),
+                    shell.StringParam("b", optional=True, rest=True),
+                ],
+                lambda self, params: None,
+            )
+        )
+    res = []
+    for line in ["noop 3 a b", "noo 3", "noop x"]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            seconds = timed(lambda: [sh.execute(line) for _ in range(n)])
+        res.append(
+            result("dispatch", {"line": line, "stats": stats}, seconds / n)
+        )
+    return res
+
+
+def git_commit() -> str | None:
+    """Returns the current git commit, if any."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes: list[int], orders: list[int]) -> dict:
+    """Runs all benchmarks and returns their results."""
+    results = []
+    with tempfile.TemporaryDirectory() as d:
+        for rows in sizes:
+            filename = os.path.join(d, f"food-{rows}.csv")
+            write_menu(filename, rows)
+            results += bench_load(filename, rows)
+            results += bench_startup(filename, rows)
+            results += bench_list(filename, rows)
+            results += bench_column_align(rows)
+    food_items = FoodItems("food.csv")
+    for n in orders:
+        results += bench_tables(food_items, n)
+        results += bench_orders(food_items, n)
+    results += bench_dispatch(10000)
+    results += bench_dispatch(10000, stats=True)
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "time": datetime.now().isoformat(),
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10, 1000, 100000],
+        help="menu sizes in rows (up to 1000000)",
+    )
+    parser.add_argument(
+        "--orders",
+        type=int,
+        nargs="+",
+        default=[100, 10000],
+        help="orders per table",
+    )
+    parser.add_argument(
+        "--json",
+        metavar="FILE",
+        help="write the results as JSON to FILE",
+    )
+    args = parser.parse_args()
+    report = run(args.sizes, args.orders)
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=1)
@@ -0,0 +1,262 @@
+__author__ = "8030456, Schuppan, 8404886, Kraus"
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import datetime
+import os
+import time
+
+
+@dataclass
+class InvoiceEntry:
+    """An order or, if rescinded is set, the rescindment of the order
+    with that index. Amounts are in cents, negative for rescindments."""
+
+    name: str
+    amount: int
+    special_requests: list[tuple[str, int]] = field(default_factory=list)
+    rescinded: int | None = None
+
+
+@dataclass
+class Invoice:
+    """A finalized table's invoice. Sinks storing more than the text
+    use the total in cents and the entries."""
+
+    time: datetime
+    table_id: str
+    text: str
+    total: int = 0
+    entries: list[InvoiceEntry] = field(default_factory=list)
+
+
+class InvoiceSink(ABC):
+    """Abstract class for invoice destinations"""
+
+    @abstractmethod
+    def name(self) -> str:
+        """Returns a description of where invoices go"""
+        pass
+
+    @abstractmethod
+    def write(self, invoice: Invoice) -> None:
+        """Writes an invoice, possibly buffered"""
+        pass
+
+    def write_many(self, invoices: list[Invoice]) -> None:
+        """Writes several invoices, buffered like write()"""
+        for invoice in invoices:
+            self.write(invoice)
+
+    def flush(self) -> None:
+        """Writes out all buffered invoices"""
+        pass
+
+    def poll(self) -> None:
+        """Flushes if a time-based flush is due. Called periodically
+        by ThreadedInvoiceSink."""
+        pass
+
+    def close(self) -> None:
+        """Flushes and releases all resources"""
+        self.flush()
+
+
+class FileInvoiceSink(InvoiceSink):
+    """Appends invoices to a text file. Invoices are buffered and
+    written every flush_count invoices or flush_interval seconds,
+    whichever comes first. With fsync=True, each flush is synced to
+    disk.
+
+    With rotate_daily=True, the invoice's date is added to the file
+    name (invoices-2024-01-31.txt). With max_bytes set, a full file
+    is renamed to the next free <name>.<n> before writing on."""
+
+    def __init__(
+        self,
+        filename: str,
+        flush_count: int = 1,
+        flush_interval: float | None = None,
+        fsync: bool = False,
+        rotate_daily: bool = False,
+        max_bytes: int | None = None,
+    ) -> None:
+        self.__filename = filename
+        self.__flush_count = flush_count
+        self.__flush_interval = flush_interval
+        self.__fsync = fsync
+        self.__rotate_daily = rotate_daily
+        self.__max_bytes = max_bytes
+        # Buffered (path, text) pairs.
+        self.__buf: list[tuple[str, str]] = []
+        self.__last_flush = time.monotonic()
+        self.__file = None
+        self.__file_path = None
+
+    def name(self) -> str:
+        return self.__filename
+
+    def path(self, invoice: Invoice) -> str:
+        """Returns the path of the file the invoice goes to"""
+        if not self.__rotate_daily:
+            return self.__filename
+        base, ext = os.path.splitext(self.__filename)
+        return f"{base}-{invoice.time.strftime('%Y-%m-%d')}{ext}"
+
+    def write(self, invoice: Invoice) -> None:
+        self.__buf.append((self.path(invoice), invoice.text + "\n"))
+        if len(self.__buf) >= self.__flush_count:
+            self.flush()
+        else:
+            self.poll()
+
+    def write_many(self, invoices: list[Invoice]) -> None:
+        """Writes the invoices in one go, whatever flush_count is."""
+        for invoice in invoices:
+            self.__buf.append((self.path(invoice), invoice.text + "\n"))
+        self.flush()
+
+    def poll(self) -> None:
+        if (
+            self.__flush_interval is not None
+            and len(self.__buf) > 0
+            and time.monotonic() - self.__last_flush >= self.__flush_interval
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        self.__last_flush = time.monotonic()
+        if len(self.__buf) == 0:
+            return
+        buf, self.__buf = self.__buf, []
+        # Group consecutive invoices for the same file into one write.
+        start = 0
+        for i in range(1, len(buf) + 1):
+            if i == len(buf) or buf[i][0] != buf[start][0]:
+                self.__write(
+                    buf[start][0], "".join(t for _, t in buf[start:i])
+                )
+                start = i
+        if self.__fsync:
+            os.fsync(self.__file.fileno())
+
+    def __write(self, path: str, data: str) -> None:
+        if self.__file is not None and path != self.__file_path:
+            self.__close_file()
+        if self.__max_bytes is not None and os.path.exists(path):
+            if os.path.getsize(path) + len(data) > self.__max_bytes:
+                self.__close_file()
+                n = 1
+                while os.path.exists(f"{path}.{n}"):
+                    n += 1
+                os.rename(path, f"{path}.{n}")
+        if self.__file is None:
+            self.__file = open(path, "a")
+            self.__file_path = path
+        self.__file.write(data)
+        self.__file.flush()
+
+    def __close_file(self) -> None:
+        if self.__file is not None:
+            if self.__fsync:
+                os.fsync(self.__file.fileno())
+            self.__file.close()
+            self.__file = None
+            self.__file_path = None
+
+    def close(self) -> None:
+        self.flush()
+        self.__close_file()
+
+
+class ThreadedInvoiceSink(InvoiceSink):
+    """Hands invoices to a background thread which writes them to
+    another sink, so the caller never blocks on disk I/O. Errors of
+    the background thread are raised by the next write() or close().
+    The thread is only started by the first write, so runs without
+    invoices don't pay for it."""
+
+    def __init__(self, sink: InvoiceSink, poll_interval: float = 0.5):
+        self.__sink = sink
+        self.__poll_interval = poll_interval
+        self.__queue = None
+        self.__error = None
+        self.__thread = None
+
+    def __start(self) -> None:
+        import queue
+        import threading
+
+        self.__queue = queue.Queue()
+        self.__thread = threading.Thread(target=self.__loop, daemon=True)
+        self.__thread.start()
+
+    def name(self) -> str:
+        return self.__sink.name()
+
+    def write(self, invoice: Invoice) -> None:
+        self.__check()
+        if self.__thread is None:
+            self.__start()
+        self.__queue.put(invoice)
+
+    def write_many(self, invoices: list[Invoice]) -> None:
+        self.__check()
+        if self.__thread is None:
+            self.__start()
+        self.__queue.put(list(invoices))
+
+    def flush(self) -> None:
+        """Waits until the background thread wrote all invoices."""
+        if self.__thread is None:
+            self.__sink.flush()
+            return
+        import threading
+
+        done = threading.Event()
+        self.__queue.put(done)
+        done.wait()
+        self.__check()
+
+    def close(self) -> None:
+        if self.__thread is None:
+            self.__sink.close()
+            return
+        self.__queue.put(None)
+        self.__thread.join()
+        self.__check()
+
+    def __check(self) -> None:
+        if self.__error is not None:
+            error, self.__error = self.__error, None
+            raise error
+
+    def __loop(self) -> None:
+        import queue
+        import threading
+
+        while True:
+            try:
+                item = self.__queue.get(timeout=self.__poll_interval)
+            except queue.Empty:
+                item = False
+            if item is None:
+                try:
+                    self.__sink.close()
+                except Exception as e:
+                    self.__error = e
+                return
+            try:
+                if item is False:
+                    self.__sink.poll()
+                elif isinstance(item, threading.Event):
+                    self.__sink.flush()
+                    item.set()
+                elif isinstance(item, list):
+                    self.__sink.write_many(item)
+                else:
+                    self.__sink.write(item)
+            except Exception as e:
+                self.__error = e
+                if isinstance(item, threading.Event):
+                    item.set()
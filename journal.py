@@ -0,0 +1,305 @@
+__author__ = "8030456, Schuppan, 8404886, Kraus"
+
+import os
+import struct
+import threading
+import time
+import zlib
+
+# Record kinds. Records are tuples starting with the kind:
+#   ("table", table_id)
+#   ("order", table_id, menu_index, time, [(request, charge), ...])
+#   ("rescind", table_id, order_index, time)
+#   ("invoice", table_id)
+#   ("item", name, type, "category,...", price)
+#   ("item_order", table_id, item_id, time, [(request, charge), ...])
+#   ("sales", group, since, [(key, units, revenue), ...])
+# Item records number food items in the order they appear since the
+# latest snapshot, starting at 0. item_order records refer to these
+# numbers, which unlike menu indexes survive menu changes. Journals
+# written before item records existed use order records. Snapshots end
+# with a sales record per group of main.SalesCounters, which replaces
+# the counts of the tables replayed before it.
+KINDS = [
+    "table",
+    "order",
+    "rescind",
+    "invoice",
+    "item",
+    "item_order",
+    "sales",
+]
+
+# Each record is framed as payload length, CRC32 of the payload and kind.
+FRAME = struct.Struct("<IIB")
+SNAPSHOT_MAGIC = b"RSJ1"
+GENERATION = struct.Struct("<Q")
+
+
+def encode(record: tuple) -> bytes:
+    """Encodes a record into its binary frame."""
+    kind = record[0]
+    payload = bytearray()
+
+    def put_str(s: str) -> None:
+        b = s.encode()
+        payload.extend(struct.pack("<H", len(b)))
+        payload.extend(b)
+
+    put_str(record[1])
+    if kind == "item":
+        _, _, item_type, categories, price = record
+        put_str(item_type)
+        put_str(categories)
+        payload.extend(struct.pack("<q", price))
+    elif kind == "order" or kind == "item_order":
+        _, _, item, t, special_requests = record
+        payload.extend(struct.pack("<IdH", item, t, len(special_requests)))
+        for request, charge in special_requests:
+            put_str(request)
+            payload.extend(struct.pack("<i", charge))
+    elif kind == "rescind":
+        payload.extend(struct.pack("<Id", record[2], record[3]))
+    elif kind == "sales":
+        _, _, since, counters = record
+        payload.extend(struct.pack("<dI", since, len(counters)))
+        for key, units, revenue in counters:
+            put_str(key)
+            payload.extend(struct.pack("<qq", units, revenue))
+    return (
+        FRAME.pack(len(payload), zlib.crc32(payload), KINDS.index(kind))
+        + payload
+    )
+
+
+def decode(kind: int, payload: bytes) -> tuple:
+    """Decodes a record from its kind and payload."""
+    pos = 0
+
+    def get(fmt: str) -> tuple:
+        nonlocal pos
+        res = struct.unpack_from(fmt, payload, pos)
+        pos += struct.calcsize(fmt)
+        return res
+
+    def get_str() -> str:
+        nonlocal pos
+        (n,) = get("<H")
+        pos += n
+        return payload[pos - n : pos].decode()
+
+    kind = KINDS[kind]
+    table_id = get_str()
+    if kind == "item":
+        return (kind, table_id, get_str(), get_str(), *get("<q"))
+    elif kind == "order" or kind == "item_order":
+        item, t, n = get("<IdH")
+        special_requests = [(get_str(), get("<i")[0]) for _ in range(n)]
+        return (kind, table_id, item, t, special_requests)
+    elif kind == "rescind":
+        return (kind, table_id, *get("<Id"))
+    elif kind == "sales":
+        since, n = get("<dI")
+        counters = [(get_str(), *get("<qq")) for _ in range(n)]
+        return (kind, table_id, since, counters)
+    return (kind, table_id)
+
+
+def read_frames(data: bytes, pos: int = 0):
+    """Yields (end offset, record) for each intact frame. Stops at the
+    first incomplete or corrupted frame, e.g. after a crash."""
+    while pos + FRAME.size <= len(data):
+        n, crc, kind = FRAME.unpack_from(data, pos)
+        payload = data[pos + FRAME.size : pos + FRAME.size + n]
+        if len(payload) != n or zlib.crc32(payload) != crc:
+            return
+        pos += FRAME.size + n
+        yield pos, decode(kind, payload)
+
+
+class Journal:
+    """Append-only write-ahead journal with snapshots. Appended
+    records are buffered and written by a background thread which
+    fsyncs them in groups every sync_interval seconds.
+
+    The directory holds snapshot.bin and one log file per snapshot
+    generation. Restarting only needs the latest snapshot and the
+    logs written after it, so call replay() before appending."""
+
+    def __init__(
+        self,
+        directory: str,
+        sync_interval: float = 0.05,
+        snapshot_every: int = 10000,
+    ) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.__dir = directory
+        self.__sync_interval = sync_interval
+        self.__snapshot_every = snapshot_every
+        self.__since_snapshot = 0
+        self.__lock = threading.Lock()
+        self.__cond = threading.Condition(self.__lock)
+        # Held while writing to disk, so appending never waits on it.
+        self.__io_lock = threading.Lock()
+        self.__buf = bytearray()
+        self.__closed = False
+        self.__gen = 0
+        try:
+            with open(self.__path("snapshot.bin"), "rb") as f:
+                if f.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC:
+                    (self.__gen,) = GENERATION.unpack(f.read(GENERATION.size))
+        except FileNotFoundError:
+            pass
+        self.__gen = max([self.__gen] + self.__log_generations())
+        self.__file = open(self.__log_path(self.__gen), "ab")
+        self.__thread = threading.Thread(target=self.__sync_loop, daemon=True)
+        self.__thread.start()
+
+    def __path(self, name: str) -> str:
+        return os.path.join(self.__dir, name)
+
+    def __log_path(self, gen: int) -> str:
+        return self.__path(f"journal.{gen}.log")
+
+    def __log_generations(self) -> list[int]:
+        gens = []
+        for name in os.listdir(self.__dir):
+            parts = name.split(".")
+            if len(parts) == 3 and parts[0] == "journal" and parts[2] == "log":
+                if parts[1].isdigit():
+                    gens.append(int(parts[1]))
+        return sorted(gens)
+
+    def replay(self):
+        """Yields all records of the latest snapshot followed by
+        all records logged after it. Cuts off torn records left by
+        a crash."""
+        snapshot_gen = 0
+        try:
+            with open(self.__path("snapshot.bin"), "rb") as f:
+                data = f.read()
+            if data.startswith(SNAPSHOT_MAGIC):
+                pos = len(SNAPSHOT_MAGIC)
+                (snapshot_gen,) = GENERATION.unpack_from(data, pos)
+                for _, record in read_frames(data, pos + GENERATION.size):
+                    yield record
+        except FileNotFoundError:
+            pass
+        for gen in self.__log_generations():
+            if gen < snapshot_gen:
+                continue
+            path = self.__log_path(gen)
+            with open(path, "rb") as f:
+                data = f.read()
+            end = 0
+            for end, record in read_frames(data):
+                # Logged records count towards the next snapshot across
+                # restarts, or short runs would never take one.
+                self.__since_snapshot += 1
+                yield record
+            if end != len(data):
+                os.truncate(path, end)
+
+    def append(self, record: tuple) -> None:
+        """Appends a record. It is written to disk within
+        sync_interval seconds or on flush()/close()."""
+        frame = encode(record)
+        with self.__cond:
+            if self.__closed:
+                raise ValueError("journal is closed")
+            self.__buf.extend(frame)
+            self.__since_snapshot += 1
+            self.__cond.notify()
+
+    def append_many(self, records) -> None:
+        """Appends several records at once, so they are written to
+        disk together."""
+        frames = b"".join(encode(record) for record in records)
+        with self.__cond:
+            if self.__closed:
+                raise ValueError("journal is closed")
+            self.__buf.extend(frames)
+            self.__since_snapshot += len(records)
+            self.__cond.notify()
+
+    def needs_snapshot(self) -> bool:
+        """Returns if enough records were appended since the last
+        snapshot to warrant a new one, including those replayed from
+        the logs after it.
+
+        >>> import tempfile
+        >>> d = tempfile.mkdtemp()
+        >>> for run in range(3):
+        ...     journal = Journal(d, snapshot_every=5)
+        ...     replayed = len(list(journal.replay()))
+        ...     print(replayed, journal.needs_snapshot())
+        ...     journal.append_many([("table", f"t{run}")] * 2)
+        ...     journal.close()
+        0 False
+        2 False
+        4 False
+        >>> journal = Journal(d, snapshot_every=5)
+        >>> len(list(journal.replay())), journal.needs_snapshot()
+        (6, True)
+        >>> journal.close()
+        """
+        return self.__since_snapshot >= self.__snapshot_every
+
+    def flush(self) -> None:
+        """Writes and fsyncs all buffered records."""
+        with self.__io_lock:
+            with self.__lock:
+                data, self.__buf = self.__buf, bytearray()
+            if len(data) > 0:
+                self.__file.write(data)
+                self.__file.flush()
+                os.fsync(self.__file.fileno())
+
+    def snapshot(self, records) -> None:
+        """Writes a snapshot of the full state given as records and
+        discards the logs it supersedes. The caller must make sure no
+        records are appended meanwhile."""
+        with self.__io_lock:
+            with self.__lock:
+                data, self.__buf = self.__buf, bytearray()
+                self.__since_snapshot = 0
+            self.__file.write(data)
+            self.__file.close()
+            self.__gen += 1
+            self.__file = open(self.__log_path(self.__gen), "ab")
+            tmp = self.__path("snapshot.bin.tmp")
+            with open(tmp, "wb") as f:
+                f.write(SNAPSHOT_MAGIC + GENERATION.pack(self.__gen))
+                for record in records:
+                    f.write(encode(record))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.__path("snapshot.bin"))
+            dir_fd = os.open(self.__dir, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+            for gen in self.__log_generations():
+                if gen < self.__gen:
+                    os.remove(self.__log_path(gen))
+
+    def close(self) -> None:
+        """Flushes all buffered records and stops the writer thread."""
+        with self.__cond:
+            self.__closed = True
+            self.__cond.notify()
+        self.__thread.join()
+        self.flush()
+        self.__file.close()
+
+    def __sync_loop(self) -> None:
+        while True:
+            with self.__cond:
+                while len(self.__buf) == 0 and not self.__closed:
+                    self.__cond.wait()
+                if self.__closed:
+                    return
+            # Give other records a chance to join this group commit.
+            time.sleep(self.__sync_interval)
+            self.flush()
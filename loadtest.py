@@ -0,0 +1,306 @@
+__author__ = "8030456, Schuppan, 8404886, Kraus"
+
+import argparse
+from collections import deque
+import contextlib
+import itertools
+import os
+import random
+import sys
+import time
+
+from invoices import FileInvoiceSink
+from main import App, create_app
+import shell
+from stats import Histogram
+from util import Util
+
+# Default weights of the commands virtual waiters run in random mode.
+MIX = {
+    "table": 10,
+    "order": 50,
+    "rescind": 5,
+    "orders": 10,
+    "tables": 1,
+    "invoice": 2,
+}
+
+
+class Waiter:
+    """A virtual waiter. Commands get the waiter as self, like a
+    server.Session: the current table is per waiter, everything else
+    is looked up on the shared App. Prompts are answered from answers,
+    or with the default answer once it is empty, or from the script
+    if the waiter runs one."""
+
+    def __init__(self, app: App, number: int, script=None) -> None:
+        self.__app = app
+        self.number = number
+        self.curr_table = None
+        # Tables this waiter opened and not yet invoiced.
+        self.own_tables: list[str] = []
+        self.opened = 0
+        self.answers: deque[str] = deque()
+        self.script = script
+
+    def __getattr__(self, name: str):
+        return getattr(self.__app, name)
+
+    def set_prompt_prefix(self, elems: list[str]) -> None:
+        pass
+
+    def read_line(self, prompt: str) -> str:
+        if self.script is not None:
+            return next(self.script)
+        if len(self.answers) > 0:
+            return self.answers.popleft()
+        return ""
+
+
+class LoadTest:
+    """Drives an App with virtual waiters through the registered
+    Command callbacks, without going through input() or a terminal.
+    Each step, a random waiter runs its next command, either from a
+    script or drawn from a weighted mix of commands. Latencies are
+    recorded per command."""
+
+    def __init__(
+        self,
+        app: App,
+        waiters: int,
+        max_tables: int = 100,
+        mix: dict[str, int] = MIX,
+        script: list[str] | None = None,
+        seed: int = 0,
+    ) -> None:
+        self.__app = app
+        self.__rng = random.Random(seed)
+        self.__max_tables = max_tables
+        self.__kinds = list(mix.keys())
+        self.__weights = list(mix.values())
+        self.__menu_size = len(app.food_items)
+        self.waiters = []
+        for i in range(waiters):
+            lines = None
+            if script is not None:
+                lines = itertools.cycle(
+                    [line.replace("{waiter}", str(i)) for line in script]
+                )
+            self.waiters.append(Waiter(app, i, lines))
+        self.latencies: dict[str, Histogram] = {}
+        self.commands = 0
+        # Number of command lines rejected by error message.
+        self.rejected: dict[str, int] = {}
+
+    def call(self, waiter: Waiter, line: str) -> float:
+        """Runs a command line as waiter and returns its latency in
+        seconds, including parsing its parameters. Lines with an
+        unknown command or invalid parameters are rejected."""
+        start = time.perf_counter()
+        try:
+            cmd, params = self.__app.parse(line)
+        except (KeyError, ValueError) as e:
+            # Reported like Shell.execute does, and counted for format.
+            msg = e.args[0]
+            print(msg)
+            self.rejected[msg] = self.rejected.get(msg, 0) + 1
+            return time.perf_counter() - start
+        steps = cmd.run(waiter, params)
+        if steps is not None:
+            shell.run_steps(steps, waiter.read_line)
+        seconds = time.perf_counter() - start
+        if cmd.name not in self.latencies:
+            self.latencies[cmd.name] = Histogram()
+        self.latencies[cmd.name].observe(seconds)
+        self.commands += 1
+        return seconds
+
+    def next_line(self, waiter: Waiter) -> str:
+        """Returns the waiter's next command line, queueing the answers
+        to its prompts."""
+        if waiter.script is not None:
+            while True:
+                line = next(waiter.script)
+                if line.strip() != "" and not line.lstrip().startswith("#"):
+                    return line
+        rng = self.__rng
+        kind = rng.choices(self.__kinds, self.__weights)[0]
+        table = self.__app.tables.get(waiter.curr_table)
+        if kind == "tables":
+            return "tables"
+        if kind == "table" or table is None:
+            if len(waiter.own_tables) < self.__max_tables:
+                waiter.opened += 1
+                name = f"w{waiter.number}-{waiter.opened}"
+                waiter.own_tables.append(name)
+            else:
+                name = rng.choice(waiter.own_tables)
+            return f"table {name}"
+        if kind == "order":
+            if rng.random() < 0.1:
+                charge = rng.choice(["y", "n"])
+                waiter.answers.extend(["s", "no onions", charge, "y"])
+            return f"order {rng.randint(1, self.__menu_size)}"
+        if kind == "rescind" and len(table.orders) > 0:
+            return f"rescind {rng.randint(1, len(table.orders))}"
+        if kind == "invoice" and len(table.orders) > 0:
+            waiter.own_tables.remove(table.id)
+            waiter.answers.append("y")
+            return "invoice"
+        return "orders"
+
+    def run(self, commands: int, every: int = 10000, out=None):
+        """Runs commands commands. Every every commands, prints the
+        number of open tables and orders with the throughput and
+        latencies since the last report to out (default stdout)."""
+        if out is None:
+            out = sys.stdout
+        rng = self.__rng
+        app = self.__app
+        print(
+            f"{'Commands':>10} {'Tables':>8} {'Orders':>10} "
+            f"{'Cmds/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}",
+            file=out,
+        )
+        interval = Histogram()
+        start = time.perf_counter()
+        for i in range(1, commands + 1):
+            waiter = rng.choice(self.waiters)
+            interval.observe(self.call(waiter, self.next_line(waiter)))
+            if i % every == 0 or i == commands:
+                elapsed = time.perf_counter() - start
+                orders = sum(s.orders for s in app.tables.summaries())
+                print(
+                    f"{i:>10} {len(app.tables):>8} {orders:>10} "
+                    f"{interval.count / elapsed:>9.0f} "
+                    f"{interval.percentile(0.5) * 1000:>8.3f} "
+                    f"{interval.percentile(0.99) * 1000:>8.3f} "
+                    f"{interval.max * 1000:>8.3f}",
+                    file=out,
+                )
+                interval = Histogram()
+                start = time.perf_counter()
+
+    def format(self) -> str:
+        """Returns a table of calls and latency percentiles per
+        command."""
+
+        def ms(seconds: float) -> str:
+            return f"{seconds * 1000:.3f}"
+
+        rows = [["Command", "Calls", "p50", "p95", "p99", "max", "Total"]]
+        for name, h in sorted(self.latencies.items()):
+            rows.append(
+                [
+                    name,
+                    str(h.count),
+                    ms(h.percentile(0.5)),
+                    ms(h.percentile(0.95)),
+                    ms(h.percentile(0.99)),
+                    ms(h.max),
+                    f"{h.sum:.3f} s",
+                ]
+            )
+        res = Util.column_align(rows, sep="  ") + "\nTimes in ms."
+        for msg, n in sorted(self.rejected.items()):
+            res += f"\nRejected {n} times: {msg.splitlines()[0]}"
+        return res
+
+
+def parse_mix(val: str) -> dict[str, int]:
+    """Parses command weights like "order=50,rescind=5". Commands not
+    given keep their default weight, a weight of 0 disables one."""
+    mix = dict(MIX)
+    for part in val.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in MIX:
+            raise argparse.ArgumentTypeError(f'unknown command "{name}"')
+        mix[name.strip()] = int(weight)
+    return mix
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Drive the restaurant shell with virtual waiters"
+    )
+    parser.add_argument("--menu", default="food.csv")
+    parser.add_argument("--waiters", type=int, default=20)
+    parser.add_argument("--commands", type=int, default=100000)
+    parser.add_argument(
+        "--tables",
+        type=int,
+        default=100,
+        metavar="N",
+        help="tables a waiter keeps open at most in random mode",
+    )
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=MIX,
+        help="command weights in random mode, e.g. order=50,invoice=0 "
+        f"(default {','.join(f'{k}={v}' for k, v in MIX.items())})",
+    )
+    parser.add_argument(
+        "--script",
+        metavar="FILE",
+        help='commands every waiter runs in a loop instead, answers to \
+prompts on the following lines as in batch mode, "{waiter}" is replaced \
+by the waiter\'s number',
+    )
+    parser.add_argument(
+        "--every",
+        type=int,
+        default=10000,
+        metavar="N",
+        help="report throughput and latencies every N commands",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--journal", metavar="DIR")
+    parser.add_argument(
+        "--table-budget",
+        type=float,
+        metavar="MB",
+        help="keep at most MB of tables in memory, spilling the rest",
+    )
+    parser.add_argument(
+        "--invoices",
+        metavar="FILE",
+        default=os.devnull,
+        help="write invoices to FILE (default: discard them)",
+    )
+    args = parser.parse_args()
+
+    script = None
+    if args.script is not None:
+        with open(args.script, "r") as f:
+            script = [line.rstrip("\n") for line in f]
+    app = create_app(
+        args.menu,
+        journal_dir=args.journal,
+        invoice_sink=FileInvoiceSink(args.invoices),
+        table_budget=(
+            None
+            if args.table_budget is None
+            else int(args.table_budget * 1e6)
+        ),
+    )
+    test = LoadTest(
+        app, args.waiters, args.tables, args.mix, script, args.seed
+    )
+    out = sys.stdout
+    start = time.perf_counter()
+    try:
+        with open(os.devnull, "w") as devnull:
+            with contextlib.redirect_stdout(devnull):
+                test.run(args.commands, args.every, out)
+        elapsed = time.perf_counter() - start
+        print()
+        print(test.format())
+        if app.tables.budget is not None:
+            print(app.tables.format_stats())
+    finally:
+        app.close()
+    print(
+        f"{test.commands} commands by {args.waiters} waiters in "
+        f"{elapsed:.2f} s ({test.commands / elapsed:.0f} commands/s)"
+    )
@@ -1,63 +1,347 @@
 __author__ = "8030456, Schuppan, 8404886, Kraus"
 
+import argparse
+from array import array
+import bisect
+from collections import OrderedDict
+from collections.abc import MutableMapping
+import fnmatch
+import heapq
 from dataclasses import dataclass, field
-from datetime import datetime
+from datetime import datetime, timedelta
+import io
+import itertools
+import os
+import sys
+import time
+from typing import TYPE_CHECKING, Callable, Sequence
+import weakref
 
 import shell
 from util import Util
 
+if TYPE_CHECKING:
+    from invoices import Invoice, InvoiceEntry, InvoiceSink
+    from stats import Stats
 
-@dataclass
+
+@dataclass(frozen=True, slots=True)
 class FoodItem:
     """Set up the attributes for the individual Food Object"""
     name: str
     type: str
-    categories: set[str]
+    categories: frozenset[str]
     price: int  # In cents.
 
 
+# Bump when the layout of menu cache files changes.
+MENU_CACHE_VERSION = 1
+# Header of the food item list, see FoodItems.row.
+ROW_HEADER = ["No.", "Name", "Type", "Tags", "Price"]
+
+
 class FoodItems:
-    """Creates Food based on food.csv and class FoodItem"""
-    def __init__(self, filename: str):
-        self.__items = []
-        with open(filename, "r") as file:
-            for i, line in enumerate(file):
-                if i == 0 or line == "":
-                    continue
-                cols = line.removesuffix("\n").split(";")
-                if len(cols) != 4:
-                    raise Exception(
-                        f"line {i}: expected semicolon- separated \
+    """Creates Food based on food.csv and class FoodItem. With
+    compact=True, the items are stored column-wise and FoodItem
+    objects are only created on access, which saves memory on
+    very large menus.
+
+    A FoodItems is never changed. To reload a menu, create a new
+    version passing the current one as previous; rows which didn't
+    change keep their FoodItem objects."""
+    def __init__(
+        self,
+        filename: str,
+        compact: bool = False,
+        previous: "FoodItems | None" = None,
+        cache: bool = False,
+    ):
+        """With cache=True, the parsed menu is kept in a cache file
+        next to it, see __load."""
+        self.version = 1 if previous is None else previous.version + 1
+        # Number of items not taken over from the previous version.
+        self.changed = 0
+        self.__index = None
+        self.__fuzzy = None
+        self.__indices = None
+        self.__row_widths = None
+        self.__compact = compact
+        # Items of the previous version by row.
+        reuse = {}
+        if previous is not None:
+            reuse = {
+                (it.name, it.type, it.categories, it.price): it
+                for it in previous
+            }
+        names, types, categories, prices = self.__load(filename, cache)
+        rows = zip(names, types, categories, prices)
+        # The shared menu the columns are read from, see attach.
+        self.__shared = None
+        if compact:
+            self.__names: Sequence[str] = names
+            self.__types: Sequence[str] = types
+            self.__categories: Sequence[frozenset[str]] = categories
+            self.__prices = array("q", prices)
+            self.changed = len(names)
+            if len(reuse) > 0:
+                self.changed = sum(1 for row in rows if row not in reuse)
+        else:
+            self.__items = []
+            for row in rows:
+                item = reuse.get(row)
+                if item is None:
+                    item = FoodItem(*row)
+                    self.changed += 1
+                self.__items.append(item)
+
+    @staticmethod
+    def attach(name: str) -> "FoodItems":
+        """Returns the menu published to shared memory under name (see
+        sharedmenu.publish) without copying or parsing it. The items
+        are stored compactly and read from the shared memory on
+        access."""
+        from sharedmenu import SharedMenu
+
+        shared = SharedMenu(name)
+        food_items = FoodItems.__new__(FoodItems)
+        food_items.version = 1
+        food_items.changed = len(shared.prices)
+        food_items.__index = None
+        food_items.__fuzzy = None
+        food_items.__indices = None
+        food_items.__row_widths = None
+        food_items.__compact = True
+        food_items.__shared = shared
+        food_items.__names = shared.names
+        food_items.__types = shared.types
+        food_items.__categories = shared.categories
+        food_items.__prices = shared.prices
+        return food_items
+
+    @staticmethod
+    def __load(filename: str, cache: bool) -> tuple[list, list, list, list]:
+        """Returns the name, type, categories and price columns of the
+        file. With cache=True, they are loaded from <filename>.cache
+        if its size and mtime or else its SHA-256 match the file's.
+        Otherwise the file is parsed and the cache rewritten."""
+        if not cache:
+            with open(filename, "r") as file:
+                return FoodItems.__columns(FoodItems.__parse(file))
+        import marshal
+
+        cache_filename = filename + ".cache"
+        try:
+            with open(cache_filename, "rb") as f:
+                # marshal.load(f) reads in small pieces, this is faster.
+                cached = marshal.loads(f.read())
+            if cached[0] != MENU_CACHE_VERSION:
+                cached = None
+        except (OSError, EOFError, ValueError, TypeError, IndexError):
+            cached = None
+        with open(filename, "rb") as f:
+            st = os.fstat(f.fileno())
+            key = (st.st_size, st.st_mtime_ns)
+            if cached is not None and cached[1] == key:
+                return cached[3]
+            data = f.read()
+        import hashlib
+
+        digest = hashlib.sha256(data).digest()
+        if cached is not None and cached[2] == digest:
+            # Same contents, e.g. after a copy.
+            columns = cached[3]
+        else:
+            text = io.TextIOWrapper(io.BytesIO(data))
+            columns = FoodItems.__columns(FoodItems.__parse(text))
+        tmp = f"{cache_filename}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                marshal.dump((MENU_CACHE_VERSION, key, digest, columns), f)
+            os.replace(tmp, cache_filename)
+        except OSError:
+            # The cache is optional, e.g. if the directory is read-only.
+            pass
+        return columns
+
+    @staticmethod
+    def __columns(rows) -> tuple[list, list, list, list]:
+        columns = ([], [], [], [])
+        for name, type, categories, price in rows:
+            columns[0].append(name)
+            columns[1].append(type)
+            columns[2].append(categories)
+            columns[3].append(price)
+        return columns
+
+    @staticmethod
+    def __parse(file):
+        """Yields (name, type, categories, price) for each row of the
+        file. Repeated type and category strings are shared."""
+        category_sets: dict[str, frozenset[str]] = {}
+        for i, line in enumerate(file):
+            if i == 0 or line.strip() == "":
+                continue
+            cols = line.removesuffix("\n").split(";")
+            if len(cols) != 4:
+                raise Exception(
+                    f"line {i}: expected semicolon- separated \
     CSV with 4 columns (name, type, category, price)"
-                    )
-                categories = set(s.strip() for s in cols[2].split(","))
-                price = 0.0
-                try:
-                    price = float(cols[3].replace(",", ".")) * 100
-                except ValueError:
-                    raise Exception(
-                        f"line {i}: expected price \
-    (3rd column) to be a floating-point number"
-                    )
-                if price % 1 != 0:
-                    raise Exception(
-                        f"line {i}: expected price (3rd column) to be \
-    at most accurate to the 0.01 decimal place (cents)"
-                    )
-                price = int(price)
-                self.__items.append(
-                    FoodItem(cols[0], cols[1], categories, price)
                 )
+            categories = category_sets.get(cols[2])
+            if categories is None:
+                categories = frozenset(
+                    sys.intern(s.strip()) for s in cols[2].split(",")
+                )
+                category_sets[cols[2]] = categories
+            try:
+                price = Util.parse_cents(cols[3])
+            except ValueError as e:
+                raise Exception(
+                    f"line {i}: expected price (3rd column) to be \
+    a number accurate to at most 0.01 (cents): {e}"
+                )
+            yield cols[0], sys.intern(cols[1]), categories, price
 
     def __iter__(self):
+        if self.__compact:
+            return map(
+                FoodItem,
+                self.__names,
+                self.__types,
+                self.__categories,
+                self.__prices,
+            )
         return iter(self.__items)
 
     def __getitem__(self, i):
+        if self.__compact:
+            return FoodItem(
+                self.__names[i],
+                self.__types[i],
+                self.__categories[i],
+                self.__prices[i],
+            )
         return self.__items[i]
 
     def __len__(self):
+        if self.__compact:
+            return len(self.__names)
         return len(self.__items)
 
+    def row(self, i: int) -> list[str]:
+        """Returns the cells of item i's line in the food item list."""
+        item = self[i]
+        return [
+            f" {i+1}.",
+            item.name,
+            item.type,
+            ",".join(sorted(item.categories)),
+            f"{Util.format_cents(item.price)} EUR",
+        ]
+
+    def row_widths(self) -> list[int]:
+        """Returns the width of each column of the full food item
+        list, computed on first use."""
+        if self.__row_widths is None:
+            rows = (self.row(i) for i in range(len(self)))
+            self.__row_widths = [
+                max(len(cell) for cell in col)
+                for col in zip(ROW_HEADER, *rows)
+            ]
+        return self.__row_widths
+
+    def index(self, item: FoodItem) -> int:
+        """Returns the index of the given item."""
+        if self.__indices is None:
+            self.__indices = {}
+            for i, it in enumerate(self):
+                self.__indices.setdefault(it, i)
+        return self.__indices[item]
+
+    def search(self, query: str | None) -> list[int]:
+        """Returns the indices of all items matching the query,
+        see search.SearchIndex. The index is built on first use."""
+        if self.__index is None:
+            from search import SearchIndex
+
+            self.__index = SearchIndex(self)
+        return self.__index.search(query)
+
+    def fuzzy_search(self, query: str | None) -> list[tuple[int, float]]:
+        """Returns (index, score) pairs of the items whose names are
+        similar to the query's words, best first, see
+        search.FuzzyIndex. Facet terms like "type:drink" filter as in
+        search(). The index is built on first use."""
+        from search import FuzzyIndex, SearchIndex
+
+        if self.__fuzzy is None:
+            self.__fuzzy = FuzzyIndex(self)
+        terms = (query or "").split()
+        facets = [t for t in terms if SearchIndex.is_facet(t)]
+        words = [t for t in terms if not SearchIndex.is_facet(t)]
+        res = self.__fuzzy.search(" ".join(words))
+        if len(facets) > 0:
+            allowed = set(self.search(" ".join(facets)))
+            res = [(i, score) for i, score in res if i in allowed]
+        return res
+
+
+class FoodItemParam(shell.Param):
+    """Parameter naming a food item by its number or by its name,
+    typos allowed, which must resolve to a unique best match. Parses
+    to the item's number. Takes the rest of the line."""
+
+    # How many candidates to suggest for ambiguous names.
+    SUGGESTIONS = 5
+
+    def __init__(self, name: str, food_items: Callable[[], FoodItems]):
+        """food_items returns the current menu."""
+        self.__name = name
+        self.__food_items = food_items
+
+    def optional(self) -> bool:
+        return False
+
+    def name(self) -> str:
+        return self.__name
+
+    def constraints(self) -> str:
+        return f"int from 1 to {len(self.__food_items())} or name..."
+
+    def rest(self) -> bool:
+        return True
+
+    def parse(self, val: str) -> int:
+        food_items = self.__food_items()
+        try:
+            i = int(val)
+        except ValueError:
+            return self.__resolve(food_items, val) + 1
+        if i < 1:
+            raise ValueError("expected number to be at least 1")
+        if i > len(food_items):
+            raise ValueError(
+                f"expected number to be at most {len(food_items)}"
+            )
+        return i
+
+    def __resolve(self, food_items: FoodItems, name: str) -> int:
+        ranked = food_items.fuzzy_search(name)
+        if len(ranked) == 0:
+            raise ValueError(f'no food item like "{name}"')
+        best = ranked[0][1]
+        top = [i for i, score in ranked if score >= best - 1e-9]
+        for i in top:
+            if food_items[i].name.lower() == name.lower():
+                return i
+        if len(top) == 1:
+            return top[0]
+        names = ", ".join(
+            f"{food_items[i].name} ({i+1})" for i in top[: self.SUGGESTIONS]
+        )
+        more = "" if len(top) <= self.SUGGESTIONS else ", ..."
+        raise ValueError(f'"{name}" is ambiguous: {names}{more}')
+
 
 @dataclass
 class SpecialRequest:
@@ -91,62 +375,1135 @@ class Rescindment:
         return -self.price
 
 
+class OrderLog:
+    """Compact, array-backed list of orders and rescindments. Order
+    and Rescindment objects are only created on access, the
+    accessor methods read the arrays directly."""
+
+    ORDER = 0
+    RESCINDMENT = 1
+
+    def __init__(self, orders=()) -> None:
+        self.__kinds = array("b")
+        # Index into the item palette for orders, index of the
+        # rescinded order for rescindments.
+        self.__items = array("l")
+        self.__times = array("d")  # POSIX timestamps.
+        self.__amounts = array("q")  # In cents, negative if rescinded.
+        # Index of the rescindment of each rescinded order, else -1.
+        self.__rescinded_by = array("l")
+        # Special requests by order index, most orders have none.
+        self.__special_requests: dict[int, list[SpecialRequest]] = {}
+        # Each distinct food item is only referenced once per log.
+        self.__palette: list[FoodItem] = []
+        self.__palette_ids: dict[FoodItem, int] = {}
+        for order in orders:
+            self.append(order)
+
+    def append(self, order: Order | Rescindment) -> None:
+        """Appends an order or rescindment."""
+        if isinstance(order, Order):
+            item = self.__palette_ids.get(order.food_item)
+            if item is None:
+                item = len(self.__palette)
+                self.__palette.append(order.food_item)
+                self.__palette_ids[order.food_item] = item
+            if len(order.special_requests) > 0:
+                self.__special_requests[len(self)] = list(
+                    order.special_requests
+                )
+            self.__kinds.append(self.ORDER)
+            self.__items.append(item)
+        elif isinstance(order, Rescindment):
+            if self.__kinds[order.item_id] != self.ORDER:
+                raise ValueError("can only rescind orders")
+            if self.__rescinded_by[order.item_id] != -1:
+                raise ValueError("order was already rescinded")
+            self.__rescinded_by[order.item_id] = len(self)
+            self.__kinds.append(self.RESCINDMENT)
+            self.__items.append(order.item_id)
+        else:
+            raise ValueError
+        self.__rescinded_by.append(-1)
+        self.__times.append(order.time.timestamp())
+        self.__amounts.append(order.amount())
+
+    def __len__(self) -> int:
+        return len(self.__kinds)
+
+    def __getitem__(self, i: int) -> Order | Rescindment:
+        if i < 0:
+            i += len(self)
+        time = datetime.fromtimestamp(self.__times[i])
+        if self.__kinds[i] == self.ORDER:
+            return Order(time, self.food_item(i), self.special_requests(i))
+        return Rescindment(time, self.__items[i], -self.__amounts[i])
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def kind(self, i: int) -> int:
+        """Returns ORDER or RESCINDMENT."""
+        return self.__kinds[i]
+
+    def amount(self, i: int) -> int:
+        """Returns the amount in cents, negative for rescindments."""
+        return self.__amounts[i]
+
+    def food_item(self, i: int) -> FoodItem:
+        """Returns the food item of an order."""
+        return self.__palette[self.__items[i]]
+
+    def time(self, i: int) -> datetime:
+        """Returns the time of an order or rescindment."""
+        return datetime.fromtimestamp(self.__times[i])
+
+    def rescinded_by(self, i: int) -> int | None:
+        """Returns the index of the rescindment of an order, or None
+        if the order wasn't rescinded."""
+        j = self.__rescinded_by[i]
+        return None if j == -1 else j
+
+    def rescinded_id(self, i: int) -> int:
+        """Returns the index of the order a rescindment rescinds."""
+        return self.__items[i]
+
+    def special_requests(self, i: int) -> list[SpecialRequest]:
+        """Returns the special requests of an order."""
+        return list(self.__special_requests.get(i, []))
+
+    def total(self) -> int:
+        """Returns the total amount in cents."""
+        return sum(self.__amounts)
+
+    def dump(self) -> tuple:
+        """Returns the log as built-in types for marshal, see load."""
+        return (
+            self.__kinds.tobytes(),
+            self.__items.tobytes(),
+            self.__times.tobytes(),
+            self.__amounts.tobytes(),
+            self.__rescinded_by.tobytes(),
+            {
+                i: [(r.request, r.charge) for r in reqs]
+                for i, reqs in self.__special_requests.items()
+            },
+            [
+                (it.name, it.type, tuple(sorted(it.categories)), it.price)
+                for it in self.__palette
+            ],
+        )
+
+    @staticmethod
+    def load(state: tuple) -> "OrderLog":
+        """Returns the log dumped by dump."""
+        kinds, items, times, amounts, rescinded_by, requests, palette = state
+        log = OrderLog()
+        log.__kinds.frombytes(kinds)
+        log.__items.frombytes(items)
+        log.__times.frombytes(times)
+        log.__amounts.frombytes(amounts)
+        log.__rescinded_by.frombytes(rescinded_by)
+        log.__special_requests = {
+            i: [SpecialRequest(*r) for r in reqs]
+            for i, reqs in requests.items()
+        }
+        log.__palette = [
+            FoodItem(
+                name,
+                sys.intern(item_type),
+                frozenset(sys.intern(c) for c in categories),
+                price,
+            )
+            for name, item_type, categories, price in palette
+        ]
+        log.__palette_ids = {it: i for i, it in enumerate(log.__palette)}
+        return log
+
+
+# Estimated memory use of an empty table and of each order without
+# its rendered line, in bytes. See Table.size.
+TABLE_BYTES = 1000
+ORDER_BYTES = 60
+
+
 @dataclass
 class Table:
-    """Creates a table with the matching orders"""
+    """Creates a table with the matching orders. The running
+    totals are kept up to date by append()."""
     id: str
-    orders: list[Order | Rescindment] = field(default_factory=list)
+    orders: OrderLog = field(default_factory=OrderLog)
+    total: int = field(init=False, default=0)  # In cents.
+    num_orders: int = field(init=False, default=0)
+    rescinded_total: int = field(init=False, default=0)  # In cents.
+
+    def __post_init__(self):
+        # Rendered lines of each order and the joined lines, if
+        # they were requested since the last append.
+        self.__lines: list[str] = []
+        self.__rendered: str | None = None
+        # Estimated memory use in bytes, see size().
+        self.__size = TABLE_BYTES
+        orders = self.orders
+        self.orders = OrderLog()
+        for order in orders:
+            self.append(order)
+
+    def append(self, order: Order | Rescindment) -> int:
+        """Appends an order or rescindment and updates the running
+        totals. Returns the change in the total amount in cents."""
+        amount = order.amount()
+        if isinstance(order, Order):
+            self.num_orders += 1
+        elif isinstance(order, Rescindment):
+            self.rescinded_total += order.price
+        else:
+            raise ValueError
+        self.orders.append(order)
+        self.total += amount
+        self.__lines.append(self.render_order(len(self.orders) - 1))
+        self.__rendered = None
+        self.__size += ORDER_BYTES + sys.getsizeof(self.__lines[-1])
+        return amount
+
+    def size(self) -> int:
+        """Returns an estimate of the table's memory use in bytes."""
+        return self.__size
+
+    def dump(self) -> tuple:
+        """Returns the table's state as built-in types, see restore."""
+        return (
+            self.id,
+            self.orders.dump(),
+            self.__lines,
+            self.total,
+            self.num_orders,
+            self.rescinded_total,
+            self.__size,
+        )
+
+    @classmethod
+    def restore(cls, state: tuple) -> "Table":
+        """Creates a table from the state returned by dump() without
+        appending and rendering its orders again."""
+        (
+            table_id,
+            orders,
+            lines,
+            total,
+            num_orders,
+            rescinded_total,
+            size,
+        ) = state
+        table = cls(table_id)
+        table.orders = OrderLog.load(orders)
+        table.total = total
+        table.num_orders = num_orders
+        table.rescinded_total = rescinded_total
+        table.__lines = lines
+        table.__size = size
+        return table
 
     def amount(self) -> int:
         """Returns the total amount in cents."""
-        return sum(o.amount() for o in self.orders)
+        return self.total
 
-    def format_orders(self) -> str:
-        res = ""
+    def is_live(self, i: int) -> bool:
+        """Returns if the entry at index i is an order which wasn't
+        rescinded."""
+        return (
+            self.orders.kind(i) == OrderLog.ORDER
+            and self.orders.rescinded_by(i) is None
+        )
+
+    def check_totals(self) -> None:
+        """Compares the running totals against a full recompute.
+        Raises an exception if they don't match."""
+        total = sum(o.amount() for o in self.orders)
+        if total != self.orders.total():
+            raise Exception(f"table {self.id}: order log out of sync")
+        num_orders = sum(isinstance(o, Order) for o in self.orders)
+        rescinded_total = sum(
+            o.price for o in self.orders if isinstance(o, Rescindment)
+        )
+        if (total, num_orders, rescinded_total) != (
+            self.total,
+            self.num_orders,
+            self.rescinded_total,
+        ):
+            raise Exception(f"table {self.id}: running totals out of sync")
         for i, order in enumerate(self.orders):
-            if isinstance(order, Order):
-                res += f" {i+1}. {order.food_item.name} \
-+{order.food_item.price/100} EUR\n"
-                for req in order.special_requests:
-                    res += f"  + {req.request} \
-({req.charge/100} EUR)\n"
-            elif isinstance(order, Rescindment):
-                res += f" {i+1}. Rescind order no. \
-{order.item_id+1} -{order.price/100} EUR\n"
+            if isinstance(order, Rescindment):
+                if self.orders.rescinded_by(order.item_id) != i:
+                    raise Exception(
+                        f"table {self.id}: rescindment index out of sync"
+                    )
+
+    def render_order(self, i: int) -> str:
+        """Renders the order or rescindment at index i, including
+        its special requests."""
+        orders = self.orders
+        if orders.kind(i) == OrderLog.ORDER:
+            food_item = orders.food_item(i)
+            parts = [
+                f" {i+1}. {food_item.name} \
++{Util.format_cents(food_item.price)} EUR\n"
+            ]
+            for req in orders.special_requests(i):
+                parts.append(
+                    f"  + {req.request} \
+({Util.format_cents(req.charge)} EUR)\n"
+                )
+            return "".join(parts)
+        return f" {i+1}. Rescind order no. \
+{orders.rescinded_id(i)+1} {Util.format_cents(orders.amount(i))} EUR\n"
+
+    def invoice(self, time: datetime) -> "Invoice":
+        """Returns the table's invoice as of the given time."""
+        from invoices import Invoice
+
+        text = "".join(
+            [
+                f"Time: {time.strftime('%Y-%m-%d %H:%M:%S')}\n",
+                f"Table: {self.id}\n",
+                "Orders:\n",
+                self.format_orders(),
+            ]
+        )
+        return Invoice(
+            time, self.id, text, self.amount(), self.invoice_entries()
+        )
+
+    def invoice_entries(self) -> list["InvoiceEntry"]:
+        """Returns the orders and rescindments as invoice entries."""
+        from invoices import InvoiceEntry
+
+        orders = self.orders
+        res = []
+        for i in range(len(orders)):
+            if orders.kind(i) == OrderLog.ORDER:
+                food_item = orders.food_item(i)
+                res.append(
+                    InvoiceEntry(
+                        food_item.name,
+                        food_item.price,
+                        [
+                            (req.request, req.charge)
+                            for req in orders.special_requests(i)
+                        ],
+                    )
+                )
             else:
-                raise ValueError
-        res += f"Total: {self.amount()/100} EUR\n"
+                j = orders.rescinded_id(i)
+                res.append(
+                    InvoiceEntry(
+                        orders.food_item(j).name,
+                        orders.amount(i),
+                        rescinded=j,
+                    )
+                )
         return res
 
+    def rendered_orders(self) -> str:
+        """Returns all rendered orders. Each order is only rendered
+        once when it's appended."""
+        if self.__rendered is None:
+            self.__rendered = "".join(self.__lines)
+        return self.__rendered
+
+    def format_orders(self, live_only: bool = False) -> str:
+        """Renders all orders and the total. With live_only=True,
+        rescinded orders and their rescindments are left out."""
+        if live_only:
+            rendered = "".join(
+                line
+                for i, line in enumerate(self.__lines)
+                if self.is_live(i)
+            )
+        else:
+            rendered = self.rendered_orders()
+        return rendered + f"Total: {Util.format_cents(self.amount())} EUR\n"
+
+
+@dataclass(slots=True)
+class TableSummary:
+    """What the table overview shows of a table, kept in memory while
+    the table itself may be spilled to disk, see TableRegistry."""
+    id: str
+    orders: int = 0
+    amount: int = 0  # In cents.
+    last_order: datetime | None = None
+
+
+class OrderIndex:
+    """Time-sorted index of the orders and rescindments of all open
+    tables. Orders arrive in time order, so adding one is an append.
+    Tables are referred to by their summaries, so spilled tables stay
+    on disk. Entries of removed tables are skipped by queries and
+    dropped once they make up half of the index."""
+
+    def __init__(self) -> None:
+        self.__times = array("d")  # POSIX timestamps, sorted.
+        self.__tables: list[TableSummary] = []
+        self.__ids = array("l")  # Index into the table's orders.
+        # Entries of removed tables still in the index.
+        self.__stale = 0
+
+    def __len__(self) -> int:
+        return len(self.__times)
+
+    def add(self, table: TableSummary, i: int, time: float) -> None:
+        """Adds the entry at index i of table's orders."""
+        pos = len(self.__times)
+        if pos > 0 and time < self.__times[-1]:
+            # The clock went back, e.g. when it was adjusted.
+            pos = bisect.bisect_right(self.__times, time)
+        self.__times.insert(pos, time)
+        self.__tables.insert(pos, table)
+        self.__ids.insert(pos, i)
+
+    def remove(self, table: TableSummary, tables: "TableRegistry") -> None:
+        """Drops the entries of a removed table. tables are the tables
+        still open."""
+        self.__stale += table.orders
+        if self.__stale * 2 > len(self.__times):
+            keep = [
+                k
+                for k, t in enumerate(self.__tables)
+                if tables.summary(t.id) is t
+            ]
+            self.__times = array("d", (self.__times[k] for k in keep))
+            self.__tables = [self.__tables[k] for k in keep]
+            self.__ids = array("l", (self.__ids[k] for k in keep))
+            self.__stale = 0
+
+    def between(
+        self, start: float, end: float, tables: "TableRegistry"
+    ) -> list[tuple[TableSummary, int]]:
+        """Returns the table and index of the entries from start until
+        before end, oldest first. tables are the tables still open."""
+        lo = bisect.bisect_left(self.__times, start)
+        hi = bisect.bisect_left(self.__times, end, lo)
+        return [
+            (self.__tables[k], self.__ids[k])
+            for k in range(lo, hi)
+            if tables.summary(self.__tables[k].id) is self.__tables[k]
+        ]
+
+
+class TableRegistry(MutableMapping):
+    """The open tables by ID. With a memory budget in bytes, the least
+    recently used tables are spilled to files in directory (or a
+    temporary directory) once the tables in memory exceed it, and are
+    loaded back when accessed. Summaries of all tables stay in memory.
+
+    Changes to a table must be reported with changed(). A spilled table
+    still referenced elsewhere, e.g. by a command waiting for input, is
+    revived instead of loaded, so there is one object per table."""
+
+    def __init__(
+        self, budget: int | None = None, directory: str | None = None
+    ) -> None:
+        self.budget = budget
+        self.__directory = directory
+        self.__temp_dir = None
+        self.__summaries: dict[str, TableSummary] = {}
+        # Tables in memory, least recently used first, and their sizes.
+        self.__resident: OrderedDict[str, Table] = OrderedDict()
+        self.__sizes: dict[str, int] = {}
+        self.resident_bytes = 0
+        # File of each spilled table, and spilled tables still in use.
+        self.__files: dict[str, str] = {}
+        self.__spilled: weakref.WeakValueDictionary[str, Table] = (
+            weakref.WeakValueDictionary()
+        )
+        self.__next_file = 0
+        self.hits = 0
+        self.misses = 0
+        # Latencies, only kept with a budget as nothing spills without.
+        self.spill_times = None
+        self.load_times = None
+        if budget is not None:
+            from stats import Histogram
+
+            self.spill_times = Histogram()
+            self.load_times = Histogram()
+
+    def __len__(self) -> int:
+        return len(self.__summaries)
+
+    def __iter__(self):
+        return iter(self.__summaries)
+
+    def __contains__(self, table_id: object) -> bool:
+        return table_id in self.__summaries
+
+    def __getitem__(self, table_id: str) -> Table:
+        table = self.__resident.get(table_id)
+        if table is not None:
+            self.__resident.move_to_end(table_id)
+            self.hits += 1
+            return table
+        if table_id not in self.__summaries:
+            raise KeyError(table_id)
+        self.misses += 1
+        start = time.perf_counter()
+        table = self.__spilled.pop(table_id, None)
+        filename = self.__files.pop(table_id)
+        if table is None:
+            table = self.__read(filename)
+        os.remove(filename)
+        self.__add_resident(table)
+        self.load_times.observe(time.perf_counter() - start)
+        self.__enforce()
+        return table
+
+    def __setitem__(self, table_id: str, table: Table) -> None:
+        if table_id in self.__summaries:
+            del self[table_id]
+        self.__summaries[table_id] = TableSummary(table_id)
+        self.__add_resident(table)
+        self.__update(table)
+        self.__enforce()
+
+    def __delitem__(self, table_id: str) -> None:
+        del self.__summaries[table_id]
+        if table_id in self.__resident:
+            del self.__resident[table_id]
+            self.resident_bytes -= self.__sizes.pop(table_id)
+        else:
+            self.__spilled.pop(table_id, None)
+            os.remove(self.__files.pop(table_id))
+
+    def summary(self, table_id: str) -> TableSummary | None:
+        """Returns the summary of a table, None if it doesn't exist."""
+        return self.__summaries.get(table_id)
+
+    def summaries(self):
+        """Returns the summaries of all tables."""
+        return self.__summaries.values()
+
+    def resident(self):
+        """Returns the tables in memory."""
+        return self.__resident.values()
+
+    def spilled(self) -> int:
+        """Returns the number of tables on disk."""
+        return len(self.__files)
+
+    def peek(self, table_id: str) -> Table:
+        """Returns a table like self[table_id], but a spilled table is
+        only read and stays spilled, and the order in which tables are
+        spilled doesn't change. Changes to a peeked table are lost."""
+        table = self.__resident.get(table_id)
+        if table is None:
+            table = self.__spilled.get(table_id)
+        if table is None:
+            table = self.__read(self.__files[table_id])
+        return table
+
+    def snapshot(self):
+        """Yields all tables without loading spilled ones into memory
+        for good, e.g. to write a journal snapshot."""
+        for table_id in self.__summaries:
+            yield self.peek(table_id)
+
+    def changed(self, table: Table) -> None:
+        """Updates the summary and size of a table after an order or
+        rescindment was appended to it."""
+        if self.__resident.get(table.id) is table:
+            self.__resident.move_to_end(table.id)
+            self.resident_bytes -= self.__sizes[table.id]
+        elif self.__spilled.get(table.id) is table:
+            del self.__spilled[table.id]
+            os.remove(self.__files.pop(table.id))
+            self.__resident[table.id] = table
+        else:
+            # The table was removed meanwhile.
+            return
+        self.__sizes[table.id] = table.size()
+        self.resident_bytes += table.size()
+        self.__update(table)
+        self.__enforce()
+
+    def close(self) -> None:
+        """Removes the spilled tables' files."""
+        for filename in self.__files.values():
+            os.remove(filename)
+        self.__files.clear()
+        if self.__temp_dir is not None:
+            os.rmdir(self.__temp_dir)
+            self.__temp_dir = None
+
+    def format_stats(self) -> str:
+        """Returns the number of tables in memory and on disk, the hit
+        rate and spill and load latencies."""
+
+        def ms(seconds: float) -> str:
+            return f"{seconds * 1000:.3f} ms"
+
+        accesses = self.hits + self.misses
+        rate = 100 * self.hits / accesses if accesses > 0 else 100
+        lines = [
+            f"In memory: {len(self.__resident)} table(s), \
+{self.resident_bytes / 1e6:.2f} of {self.budget / 1e6:.2f} MB; \
+on disk: {len(self.__files)} table(s).",
+            f"Hits: {self.hits}, misses: {self.misses} ({rate:.1f}% hits).",
+        ]
+        for name, h in [
+            ("Spill", self.spill_times),
+            ("Load", self.load_times),
+        ]:
+            lines.append(
+                f"{name}s: {h.count}, p50 {ms(h.percentile(0.5))}, \
+p99 {ms(h.percentile(0.99))}, max {ms(h.max)}."
+            )
+        return "\n".join(lines)
+
+    def __add_resident(self, table: Table) -> None:
+        self.__resident[table.id] = table
+        self.__sizes[table.id] = table.size()
+        self.resident_bytes += table.size()
+
+    def __update(self, table: Table) -> None:
+        summary = self.__summaries[table.id]
+        summary.orders = len(table.orders)
+        summary.amount = table.amount()
+        if len(table.orders) > 0:
+            summary.last_order = table.orders.time(len(table.orders) - 1)
+
+    def __enforce(self) -> None:
+        """Spills the least recently used tables until the tables in
+        memory fit the budget, except for the most recently used."""
+        if self.budget is None:
+            return
+        while self.resident_bytes > self.budget and len(self.__resident) > 1:
+            table_id, table = self.__resident.popitem(last=False)
+            self.__spill(table)
+
+    def __spill(self, table: Table) -> None:
+        import marshal
+
+        start = time.perf_counter()
+        if self.__directory is None:
+            import tempfile
+
+            self.__directory = self.__temp_dir = tempfile.mkdtemp(
+                prefix="tables-"
+            )
+        else:
+            os.makedirs(self.__directory, exist_ok=True)
+        filename = os.path.join(self.__directory, f"{self.__next_file}.table")
+        self.__next_file += 1
+        with open(filename, "wb") as f:
+            f.write(marshal.dumps(table.dump()))
+        self.__files[table.id] = filename
+        self.__spilled[table.id] = table
+        self.resident_bytes -= self.__sizes.pop(table.id)
+        self.spill_times.observe(time.perf_counter() - start)
+
+    @staticmethod
+    def __read(filename: str) -> Table:
+        import marshal
+
+        with open(filename, "rb") as f:
+            return Table.restore(marshal.loads(f.read()))
+
+
+class SalesCounters:
+    """Units sold and revenue in cents per food item, type and
+    category since start, net of rescindments. Special request charges
+    count towards the item. Food items are counted by name, so they
+    keep their counts when the menu is reloaded. With a journal, the
+    counters are kept in its snapshots and survive restarts."""
+
+    GROUPS = ["item", "type", "category"]
+
+    def __init__(self) -> None:
+        self.since = datetime.now()
+        self.sold = 0
+        self.revenue = 0
+        # [units, revenue] by key of each group.
+        self.__counters: dict[str, dict[str, list[int]]] = {
+            group: {} for group in self.GROUPS
+        }
+
+    def add(self, item: FoodItem, units: int, amount: int) -> None:
+        """Adds units of item sold for amount cents. Both are negative
+        for rescindments."""
+        self.sold += units
+        self.revenue += amount
+        for group, keys in [
+            ("item", [item.name]),
+            ("type", [item.type]),
+            ("category", item.categories),
+        ]:
+            counters = self.__counters[group]
+            for key in keys:
+                counter = counters.get(key)
+                if counter is None:
+                    counter = counters[key] = [0, 0]
+                counter[0] += units
+                counter[1] += amount
+
+    def get(self, group: str, key: str) -> tuple[int, int]:
+        """Returns the units sold and revenue of a key of a group."""
+        return tuple(self.__counters[group].get(key, (0, 0)))
+
+    def counters(self, group: str) -> list[tuple[str, int, int]]:
+        """Returns (key, units, revenue) of all keys of a group."""
+        return [
+            (key, units, revenue)
+            for key, (units, revenue) in self.__counters[group].items()
+        ]
+
+    def restore(
+        self, group: str, counters: list[tuple[str, int, int]]
+    ) -> None:
+        """Replaces the counters of a group with those returned by
+        counters(). Each sale counts towards exactly one item, so the
+        item group also gives the totals."""
+        self.__counters[group] = {
+            key: [units, revenue] for key, units, revenue in counters
+        }
+        if group == "item":
+            self.sold = sum(units for _, units, _ in counters)
+            self.revenue = sum(revenue for _, _, revenue in counters)
+
+    def top(
+        self, group: str, n: int, by: str = "revenue"
+    ) -> list[tuple[str, int, int]]:
+        """Returns (key, units, revenue) of the n best selling keys of
+        a group by "revenue" or units "sold", best first. Keys whose
+        sales were all rescinded are left out."""
+        i = 1 if by == "revenue" else 0
+        return [
+            (key, counter[0], counter[1])
+            for key, counter in heapq.nlargest(
+                n,
+                (kv for kv in self.__counters[group].items() if kv[1][0]),
+                key=lambda kv: (kv[1][i], kv[1][1 - i]),
+            )
+        ]
+
 
 class App(shell.Shell):
     """Creates App as part of Shell"""
-    def __init__(self, food_items_filename):
+    def __init__(
+        self,
+        food_items_filename,
+        debug: bool = False,
+        compact_menu: bool = False,
+        journal_dir: str | None = None,
+        invoice_sink: "InvoiceSink | None" = None,
+        menu_cache: bool = False,
+        shared_menu: str | None = None,
+        table_budget: int | None = None,
+        spill_dir: str | None = None,
+    ):
+        """With shared_menu set, the menu published to shared memory
+        under that name is used instead of the menu file, and it isn't
+        reloaded. With table_budget set, tables exceeding that many
+        bytes in memory are spilled to spill_dir, see TableRegistry."""
         super().__init__()
-        self.food_items = FoodItems(food_items_filename)
-        self.tables: dict[str, Table] = {}
+        if invoice_sink is None:
+            from invoices import FileInvoiceSink
+
+            invoice_sink = FileInvoiceSink("invoices.txt")
+        self.invoice_sink = invoice_sink
+        self.__menu_filename = food_items_filename
+        self.__compact_menu = compact_menu
+        self.__menu_cache = menu_cache
+        self.__shared_menu = shared_menu
+        # Only computed once the file changes, None until then.
+        self.__menu_digest = None
+        # The current menu version. Replaced as a whole on reload, so
+        # commands should only look it up once.
+        if shared_menu is None:
+            self.__menu_stat = self.__stat_menu()
+            self.food_items = FoodItems(
+                food_items_filename, compact_menu, cache=menu_cache
+            )
+        else:
+            self.__menu_stat = None
+            self.food_items = FoodItems.attach(shared_menu)
+        # Message about the last reload, shown before the next command.
+        self.__menu_notice = None
+        self.__watching = None
+        # Food items journaled since the latest snapshot, see journal.
+        self.__journal_items: dict[FoodItem, int] = {}
+        self.__journal_item_list: list[FoodItem] = []
+        self.tables = TableRegistry(table_budget, spill_dir)
         self.curr_table = None
+        # All orders by time, and tables with orders by the time of
+        # their latest one, least recent first.
+        self.__order_index = OrderIndex()
+        self.__last_orders: OrderedDict[str, TableSummary] = OrderedDict()
+        # Kept when tables are invoiced.
+        self.sales = SalesCounters()
+        # Total amount of all open tables in cents.
+        self.total = 0
+        # Check running totals against a full recompute.
+        self.debug = debug
+        self.journal = None
+        if journal_dir is not None:
+            from journal import Journal
+
+            self.journal = Journal(journal_dir)
+            for record in self.journal.replay():
+                self.__apply(record)
+            if self.journal.needs_snapshot():
+                self.journal.snapshot(self.__snapshot_records())
+
+    def open_table(self, table_id: str) -> Table:
+        """Creates a new table and returns it."""
+        table = Table(table_id)
+        self.tables[table_id] = table
+        self.__log(("table", table_id))
+        return table
+
+    def add_order(self, table: Table, order: Order | Rescindment) -> None:
+        """Appends an order or rescindment to the given table."""
+        self.total += table.append(order)
+        self.tables.changed(table)
+        if isinstance(order, Order):
+            self.sales.add(order.food_item, 1, order.amount())
+        else:
+            self.sales.add(
+                table.orders.food_item(order.item_id), -1, order.amount()
+            )
+        summary = self.tables.summary(table.id)
+        self.__order_index.add(
+            summary, len(table.orders) - 1, order.time.timestamp()
+        )
+        self.__last_orders[table.id] = summary
+        self.__last_orders.move_to_end(table.id)
+        if self.journal is not None:
+            self.__log(*self.__order_records(table.id, order))
+
+    def remove_table(self, table_id: str) -> Table:
+        """Removes a table and returns it."""
+        return self.remove_tables([table_id])[0]
+
+    def remove_tables(self, table_ids: list[str]) -> list[Table]:
+        """Removes several tables at once and returns them. Raises a
+        KeyError without removing any table if one doesn't exist."""
+        tables = [self.tables[table_id] for table_id in table_ids]
+        for table in tables:
+            summary = self.tables.summary(table.id)
+            del self.tables[table.id]
+            self.total -= table.amount()
+            self.__last_orders.pop(table.id, None)
+            self.__order_index.remove(summary, self.tables)
+        self.__log(*(("invoice", table.id) for table in tables))
+        return tables
+
+    def recent(self, since: datetime) -> list[tuple[Table, int]]:
+        """Returns the table and index of all orders and rescindments
+        of open tables since the given time, oldest first. Spilled
+        tables are only peeked at, see TableRegistry.peek."""
+        tables: dict[str, Table] = {}
+        res = []
+        for summary, i in self.__order_index.between(
+            since.timestamp(), float("inf"), self.tables
+        ):
+            table = tables.get(summary.id)
+            if table is None:
+                table = tables[summary.id] = self.tables.peek(summary.id)
+            res.append((table, i))
+        return res
+
+    def idle_tables(self, since: datetime) -> list[TableSummary]:
+        """Returns the summaries of the tables whose latest order or
+        rescindment was before the given time, least recent first.
+        Tables without orders aren't included."""
+        res = []
+        for summary in self.__last_orders.values():
+            if summary.last_order >= since:
+                break
+            res.append(summary)
+        return res
+
+    def __stat_menu(self) -> tuple[int, int]:
+        st = os.stat(self.__menu_filename)
+        return st.st_mtime_ns, st.st_size
+
+    def __digest_menu(self) -> bytes:
+        import hashlib
+
+        with open(self.__menu_filename, "rb") as f:
+            return hashlib.sha256(f.read()).digest()
+
+    def reload_menu(self) -> bool:
+        """Loads a new menu version if the menu file's contents
+        changed. Returns if they did. Safe to call from another thread:
+        the new version is built aside and swapped in at once."""
+        if self.__shared_menu is not None:
+            return False
+        try:
+            stat = self.__stat_menu()
+            if stat == self.__menu_stat:
+                return False
+            self.__menu_stat = stat
+            digest = self.__digest_menu()
+            if digest == self.__menu_digest:
+                return False
+            food_items = FoodItems(
+                self.__menu_filename,
+                self.__compact_menu,
+                previous=self.food_items,
+                cache=self.__menu_cache,
+            )
+        except Exception as e:
+            self.__menu_notice = f"Menu not reloaded: {e}"
+            return False
+        self.__menu_digest = digest
+        self.food_items = food_items
+        self.__menu_notice = f"Menu reloaded (version {food_items.version}, \
+{len(food_items)} items, {food_items.changed} new or changed)."
+        return True
+
+    def watch_menu(self, interval: float = 1.0) -> None:
+        """Reloads the menu in a background thread whenever its file
+        changes, checking every interval seconds."""
+        import threading
+
+        self.__watching = threading.Event()
+
+        def watch(stop) -> None:
+            while not stop.wait(interval):
+                self.reload_menu()
 
+        threading.Thread(
+            target=watch, args=(self.__watching,), daemon=True
+        ).start()
 
-def run():
-    """Use to run the full project"""
-    app = App("food.csv")
+    def execute_steps(self, line: str, session: object = None):
+        notice, self.__menu_notice = self.__menu_notice, None
+        if notice is not None:
+            print(notice)
+        return super().execute_steps(line, session)
+
+    def close(self) -> None:
+        """Writes out all pending state. Call before exiting."""
+        if self.__watching is not None:
+            self.__watching.set()
+        self.invoice_sink.close()
+        if self.journal is not None:
+            self.journal.close()
+        self.tables.close()
+
+    def __order_records(self, table_id: str, order: Order | Rescindment):
+        """Yields the journal records of an order, preceded by an item
+        record if its food item wasn't journaled yet."""
+        if isinstance(order, Rescindment):
+            yield ("rescind", table_id, order.item_id, order.time.timestamp())
+            return
+        item = order.food_item
+        item_id = self.__journal_items.get(item)
+        if item_id is None:
+            item_id = self.__add_journal_item(item)
+            yield (
+                "item",
+                item.name,
+                item.type,
+                ",".join(sorted(item.categories)),
+                item.price,
+            )
+        yield (
+            "item_order",
+            table_id,
+            item_id,
+            order.time.timestamp(),
+            [(r.request, r.charge) for r in order.special_requests],
+        )
+
+    def __add_journal_item(self, item: FoodItem) -> int:
+        self.__journal_items[item] = len(self.__journal_item_list)
+        self.__journal_item_list.append(item)
+        return len(self.__journal_item_list) - 1
+
+    def __log(self, *records: tuple) -> None:
+        if self.journal is None:
+            return
+        self.journal.append_many(records)
+        if self.journal.needs_snapshot():
+            self.journal.snapshot(self.__snapshot_records())
+
+    def __snapshot_records(self):
+        # Item numbers start over with each snapshot.
+        self.__journal_items = {}
+        self.__journal_item_list = []
+        for table in self.tables.snapshot():
+            yield ("table", table.id)
+            for order in table.orders:
+                yield from self.__order_records(table.id, order)
+        since = self.sales.since.timestamp()
+        for group in SalesCounters.GROUPS:
+            yield ("sales", group, since, self.sales.counters(group))
+
+    def __apply(self, record: tuple) -> None:
+        """Applies a journal record without logging it again."""
+        journal, self.journal = self.journal, None
+        try:
+            kind, table_id = record[0], record[1]
+            if kind == "table":
+                self.open_table(table_id)
+            elif kind == "item":
+                _, name, item_type, categories, price = record
+                item = FoodItem(
+                    name,
+                    sys.intern(item_type),
+                    frozenset(sys.intern(c) for c in categories.split(",")),
+                    price,
+                )
+                try:
+                    # Share the menu's object if the item is unchanged.
+                    item = self.food_items[self.food_items.index(item)]
+                except KeyError:
+                    pass
+                self.__add_journal_item(item)
+            elif kind == "order" or kind == "item_order":
+                _, _, item, t, special_requests = record
+                if kind == "order":
+                    food_item = self.food_items[item]
+                else:
+                    food_item = self.__journal_item_list[item]
+                self.add_order(
+                    self.tables[table_id],
+                    Order(
+                        datetime.fromtimestamp(t),
+                        food_item,
+                        [SpecialRequest(*r) for r in special_requests],
+                    ),
+                )
+            elif kind == "rescind":
+                _, _, order_id, t = record
+                table = self.tables[table_id]
+                self.add_order(
+                    table,
+                    Rescindment(
+                        datetime.fromtimestamp(t),
+                        order_id,
+                        table.orders.amount(order_id),
+                    ),
+                )
+            elif kind == "invoice":
+                self.remove_table(table_id)
+            elif kind == "sales":
+                _, group, since, counters = record
+                self.sales.since = datetime.fromtimestamp(since)
+                self.sales.restore(group, counters)
+            if kind in ["order", "item_order", "rescind"]:
+                # Without a snapshot, the counters go back to the first
+                # order journaled instead of the restart.
+                t = datetime.fromtimestamp(record[3])
+                if t < self.sales.since:
+                    self.sales.since = t
+        finally:
+            self.journal = journal
+
+    def check_totals(self) -> None:
+        """Compares all running totals against a full recompute.
+        Raises an exception if they don't match."""
+        for table in self.tables.resident():
+            table.check_totals()
+            if self.tables.summary(table.id).amount != table.amount():
+                raise Exception(f"table {table.id}: summary out of sync")
+        if self.total != sum(s.amount for s in self.tables.summaries()):
+            raise Exception("grand total out of sync")
+
+
+WELCOME = "Welcome to the RESTAURANT SHELL 9000!"
+# Lists longer than this are printed without measuring them first.
+STREAM_LIST_ROWS = 200
+# Maximum width of each column of the food item list.
+LIST_MAX_WIDTHS = [None, 40, 16, 32, None]
+
+
+def table_filter(query: str | None):
+    """Returns a function telling whether a table, given by its
+    TableSummary, matches the query at a given time. Terms are table
+    name patterns like "t*" (any of them must match), "idle:MINUTES"
+    for tables without orders for that long and "min:AMOUNT" for
+    tables owing at least AMOUNT EUR. Raises
+    a ValueError if the query is malformed."""
+    patterns = []
+    idle = None
+    min_amount = None
+    for term in (query or "").split():
+        if term.startswith("idle:"):
+            try:
+                idle = float(term.removeprefix("idle:")) * 60
+            except ValueError:
+                raise ValueError(f'invalid idle time "{term}"')
+        elif term.startswith("min:"):
+            try:
+                min_amount = Util.parse_cents(term.removeprefix("min:"))
+            except ValueError:
+                raise ValueError(f'invalid amount "{term}"')
+        else:
+            patterns.append(term)
+
+    def match(table: TableSummary, now: datetime) -> bool:
+        if len(patterns) > 0 and not any(
+            fnmatch.fnmatchcase(table.id, p) for p in patterns
+        ):
+            return False
+        if min_amount is not None and table.amount < min_amount:
+            return False
+        if idle is not None:
+            if (now - table.last_order).total_seconds() < idle:
+                return False
+        return True
+
+    return match
+
+
+def create_app(
+    food_items_filename: str = "food.csv",
+    debug: bool = False,
+    compact_menu: bool = False,
+    journal_dir: str | None = None,
+    invoice_sink: "InvoiceSink | None" = None,
+    stats: "Stats | None" = None,
+    menu_cache: bool = False,
+    shared_menu: str | None = None,
+    table_budget: int | None = None,
+    spill_dir: str | None = None,
+) -> App:
+    """Creates the App and registers all commands. Command latencies
+    are recorded in stats (a stats.Stats) if given. With menu_cache
+    set, the parsed menu is cached next to the menu file. With
+    shared_menu set, the menu published under that name is used, see
+    sharedmenu.py. With table_budget set, tables beyond that many
+    bytes are spilled to spill_dir, see TableRegistry."""
+    app = App(
+        food_items_filename,
+        debug=debug,
+        compact_menu=compact_menu,
+        journal_dir=journal_dir,
+        invoice_sink=invoice_sink,
+        menu_cache=menu_cache,
+        shared_menu=shared_menu,
+        table_budget=table_budget,
+        spill_dir=spill_dir,
+    )
 
     def cmd_table(self, params: list[object]) -> None:
         """Switches to a table with the specified ID. Creates
         a new table if necessary."""
         table = params[0]
-        if (
-            self.curr_table is not None
-            and self.tables[self.curr_table] is not None
-            and table == self.curr_table
-        ):
+        if table == self.curr_table and table in self.tables:
             print(f"Table {table} already selected.")
             return
         new = ""
         if table not in self.tables:
             new = "new "
-            self.tables[table] = Table(table)
+            self.open_table(table)
+        else:
+            # Loads the table if it was spilled to disk.
+            self.tables[table]
         print(f'Switched to {new}table "{table}".')
         self.curr_table = table
         self.set_prompt_prefix([f"table={table}"])
@@ -154,55 +1511,76 @@ def run():
     def cmd_tables(self, params: list[object]) -> None:
         """Lists all existing tables and their current orders
         and total amounts."""
+        if self.debug:
+            self.check_totals()
         if len(self.tables) == 0:
             print("No tables.")
         else:
             print("Tables:")
             rows = []
             for name in sorted(self.tables.keys()):
-                table = self.tables[name]
-                orders = len(table.orders) if table.orders else "no"
-                plural = "" if len(table.orders) == 1 else "s"
+                # Summaries don't load spilled tables.
+                summary = self.tables.summary(name)
+                orders = summary.orders if summary.orders else "no"
+                plural = "" if summary.orders == 1 else "s"
                 rows.append(
                     [
                         f" * {name}",
                         f"{orders} order{plural}",
-                        f"{table.amount()/100} EUR",
+                        f"{Util.format_cents(summary.amount)} EUR",
                     ]
                 )
-            print(Util.column_align(rows, sep="  "))
+            yield from Util.page(Util.column_align_lines(rows, sep="  "))
+            print(f"Total: {Util.format_cents(self.total)} EUR")
+        if self.tables.budget is not None:
+            print(self.tables.format_stats())
 
     def cmd_list(self, params: list[object]) -> None:
-        """Lists all food items."""
+        """Lists all food items matching the filter. Words are matched
+        as substrings, "type:", "category:" and "price<", "price>" etc.
+        filter by type, category and price. Without exact matches,
+        items with similar names are listed, best first."""
+        food_items = self.food_items
+        try:
+            ids = food_items.search(params[0])
+        except ValueError as e:
+            print(f"Error: list: filter: {e}.")
+            return
+        if len(ids) == 0 and params[0] is not None:
+            ids = [i for i, _ in food_items.fuzzy_search(params[0])]
+            if len(ids) > 0:
+                print("No exact matches, showing similar items first.")
         print("Food items:")
-        rows = [["No.", "Name", "Type", "Tags", "Price"]]
-        for i, item in enumerate(self.food_items):
-            search_str = f"{item.name} {item.type} {item.categories}"
-            if params[0] is not None:
-                if params[0].lower() not in search_str.lower():
-                    continue
-            rows.append(
-                [
-                    f" {i+1}.",
-                    item.name,
-                    item.type,
-                    ",".join(item.categories),
-                    f"{item.price/100} EUR",
-                ]
+        rows = itertools.chain([ROW_HEADER], (food_items.row(i) for i in ids))
+        widths = None
+        if len(ids) > STREAM_LIST_ROWS:
+            # Stream long lists using the full list's column widths.
+            widths = food_items.row_widths()
+        yield from Util.page(
+            Util.column_align_lines(
+                rows, sep="  ", widths=widths, max_widths=LIST_MAX_WIDTHS
             )
-        print(Util.column_align(rows, sep="  "))
+        )
 
     def cmd_order(self, params: list[object]) -> None:
         """Places an order for the current table. Allows
         for specifying a special request, which can be specified
         to optionally add a 1 EUR charge or not."""
-        if self.curr_table is None or self.tables[self.curr_table] is None:
+        if self.curr_table not in self.tables:
             print("Must select a table before placing an order.")
             print('Use the "table" command to create/select a table.')
             return
         curr_table = self.tables[self.curr_table]
 
-        item = self.food_items[params[0] - 1]
+        food_items = self.food_items
+        if params[0] > len(food_items):
+            # The menu was reloaded since the parameter was checked.
+            print(
+                f"Error: order: item: expected number to be at most \
+{len(food_items)}."
+            )
+            return
+        item = food_items[params[0] - 1]
         special_requests = []
         while True:
             print(
@@ -212,19 +1590,27 @@ table {curr_table.id}."
             if len(special_requests) > 0:
                 print("Special requests:")
                 for req in special_requests:
-                    print(f" * {req.request} ({req.charge/100} EUR)")
+                    print(
+                        f" * {req.request} \
+({Util.format_cents(req.charge)} EUR)"
+                    )
             print("Options:")
             print("  y: Confirm (default)")
             print("  n: Cancel")
             print("  s: Add special request")
-            sel = input("Selection [Yns]: ").lower()
+            sel = (yield "Selection [Yns]: ").lower()
+            if self.tables.get(curr_table.id) is not curr_table:
+                # Only possible when serving several terminals.
+                print(f"Table {curr_table.id} was closed meanwhile.")
+                break
             if sel == "y" or sel == "":
-                curr_table.orders.append(
+                self.add_order(
+                    curr_table,
                     Order(
                         datetime.now(),
                         item,
                         special_requests,
-                    )
+                    ),
                 )
                 print("Order placed.")
                 break
@@ -232,11 +1618,11 @@ table {curr_table.id}."
                 print("Order cancelled.")
                 break
             elif sel == "s":
-                req = input("Special request: ")
+                req = yield "Special request: "
                 print("Charge for 1 EUR for special request?")
                 print("  y: Confirm")
                 print("  n: Cancel (default)")
-                charge = input("Selection [yN]: ").lower() == "y"
+                charge = (yield "Selection [yN]: ").lower() == "y"
                 special_requests.append(
                     SpecialRequest(req, 100 if charge else 0)
                 )
@@ -245,8 +1631,9 @@ table {curr_table.id}."
             print()
 
     def cmd_orders(self, params: list[object]) -> None:
-        """Lists the current table's orders and the total amount."""
-        if self.curr_table is None or self.tables[self.curr_table] is None:
+        """Lists the current table's orders and the total amount.
+        The "live" view leaves out rescinded orders."""
+        if self.curr_table not in self.tables:
             print("No table selected.")
             return
         curr_table = self.tables[self.curr_table]
@@ -256,11 +1643,11 @@ table {curr_table.id}."
             return
 
         print(f"Orders for table {curr_table.id}:")
-        print(curr_table.format_orders(), end="")
+        print(curr_table.format_orders(params[0] == "live"), end="")
 
     def cmd_rescind(self, params: list[object]) -> None:
         """Rescinds an existing order."""
-        if self.curr_table is None or self.tables[self.curr_table] is None:
+        if self.curr_table not in self.tables:
             print("No table selected.")
             return
         curr_table = self.tables[self.curr_table]
@@ -272,19 +1659,105 @@ table {curr_table.id}."
 to list orders.'
             )
             return
-        order = curr_table.orders[order_id]
-        if not isinstance(order, Order):
+        orders = curr_table.orders
+        if orders.kind(order_id) != OrderLog.ORDER:
             print("Can only rescind orders.")
             return
-        curr_table.orders.append(
-            Rescindment(datetime.now(), order_id, order.amount())
+        rescinded_by = orders.rescinded_by(order_id)
+        if rescinded_by is not None:
+            time = orders.time(rescinded_by).strftime("%H:%M:%S")
+            print(
+                f"Order {order_id+1} was already rescinded \
+(order no. {rescinded_by+1} at {time})."
+            )
+            return
+        amount = orders.amount(order_id)
+        self.add_order(
+            curr_table,
+            Rescindment(datetime.now(), order_id, amount),
         )
         print(f"Rescinded order {order_id+1} \
-({order.food_item.name}) for {order.amount()/100} EUR.")
+({orders.food_item(order_id).name}) for {Util.format_cents(amount)} EUR.")
+
+    def cmd_recent(self, params: list[object]) -> None:
+        """Lists the orders and rescindments of all tables in the
+        last minutes (default 15), oldest first."""
+        minutes = 15 if params[0] is None else params[0]
+        since = datetime.now() - timedelta(minutes=minutes)
+        entries = self.recent(since)
+        if len(entries) == 0:
+            print(f"No orders in the last {minutes} minutes.")
+            return
+        print(f"Orders since {since.strftime('%H:%M:%S')}:")
+        rows = []
+        for table, i in entries:
+            lines = table.render_order(i).splitlines()
+            time = table.orders.time(i).strftime("%H:%M:%S")
+            rows.append([f" {time}", table.id, lines[0].lstrip()])
+            rows.extend(["", "", line] for line in lines[1:])
+        yield from Util.page(Util.column_align_lines(rows, sep="  "))
+        plural = "" if len(entries) == 1 else "s"
+        print(f"{len(entries)} order{plural} in the last {minutes} minutes.")
+
+    def cmd_idle(self, params: list[object]) -> None:
+        """Lists the tables without orders or rescindments in the last
+        minutes (default 60), longest idle first."""
+        minutes = 60 if params[0] is None else params[0]
+        now = datetime.now()
+        tables = self.idle_tables(now - timedelta(minutes=minutes))
+        if len(tables) == 0:
+            print(f"No tables idle for {minutes} minutes.")
+            return
+        print(f"Tables idle for {minutes} minutes:")
+        rows = []
+        for table in tables:
+            last = table.last_order
+            idle = int((now - last).total_seconds() // 60)
+            rows.append(
+                [
+                    f" * {table.id}",
+                    f"last order {last.strftime('%H:%M:%S')}",
+                    f"{idle} min ago",
+                    f"{Util.format_cents(table.amount)} EUR",
+                ]
+            )
+        yield from Util.page(Util.column_align_lines(rows, sep="  "))
+
+    def cmd_top(self, params: list[object]) -> None:
+        """Lists the best selling food items, types or categories
+        since start, including invoiced tables and, with a journal,
+        tables invoiced before a restart."""
+        group = params[0] or "item"
+        n = 10 if params[1] is None else params[1]
+        by = params[2] or "revenue"
+        sales = self.sales
+        top = sales.top(group, n, by)
+        if len(top) == 0:
+            print("Nothing sold yet.")
+            return
+        groups = {"item": "items", "type": "types", "category": "categories"}
+        print(
+            f"Top {len(top)} {groups[group]} by {by} since \
+{sales.since.strftime('%Y-%m-%d %H:%M:%S')}:"
+        )
+        rows = [
+            [
+                f" {i}.",
+                key,
+                f"{units} sold",
+                f"{Util.format_cents(revenue)} EUR",
+            ]
+            for i, (key, units, revenue) in enumerate(top, 1)
+        ]
+        print(Util.column_align(rows, sep="  "))
+        print(
+            f"Sold {sales.sold} for {Util.format_cents(sales.revenue)} EUR, \
+{Util.format_cents(self.total)} EUR of it open."
+        )
 
     def cmd_invoice(self, params: list[object]):
         """Finalize an order, creating an invoice and writing it to a file."""
-        if self.curr_table is None or self.tables[self.curr_table] is None:
+        if self.curr_table not in self.tables:
             print("No table selected.")
             return
         curr_table = self.tables[self.curr_table]
@@ -293,29 +1766,94 @@ to list orders.'
             print(f"No orders for table {curr_table.id}.")
             return
 
-        invoice = ""
-        invoice += f"Time: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}\n"
-        invoice += f"Table: {curr_table.id}\n"
-        invoice += "Orders:\n"
-        invoice += curr_table.format_orders()
-        print(invoice)
+        invoice = curr_table.invoice(datetime.now())
+        print(invoice.text)
         print(f"Delete table {curr_table.id} and save invoice to file?")
         print("  y: Confirm")
         print("  n: Cancel (default)")
-        sel = input("Selection [yN]: ").lower()
+        sel = (yield "Selection [yN]: ").lower()
+        if self.tables.get(curr_table.id) is not curr_table:
+            # Only possible when serving several terminals.
+            print(f"Table {curr_table.id} was closed meanwhile.")
+            return
         if sel == "y":
-            FILENAME = "invoices.txt"
-            with open(FILENAME, "a") as f:
-                f.write(invoice + "\n")
-            del self.tables[self.curr_table]
+            self.invoice_sink.write(invoice)
+            self.remove_table(self.curr_table)
             self.curr_table = None
             self.set_prompt_prefix([])
             print(
-                f"Saved table {curr_table.id}'s orders to {FILENAME} and deleted the table from memory."
+                f"Saved table {curr_table.id}'s orders to \
+{self.invoice_sink.name()} and deleted the table from memory."
             )
         else:
             return
 
+    def cmd_invoice_all(self, params: list[object]) -> None:
+        """Invoices all tables with orders matching the filter (see
+        table_filter) after a single confirmation. All invoices are
+        written in one batch, and the tables are only deleted once
+        that succeeded."""
+        try:
+            match = table_filter(params[0])
+        except ValueError as e:
+            print(f"Error: invoice-all: filter: {e}.")
+            return
+        now = datetime.now()
+        # Spilled tables are only loaded once confirmed.
+        summaries = [
+            summary
+            for summary in sorted(self.tables.summaries(), key=lambda s: s.id)
+            if summary.orders > 0 and match(summary, now)
+        ]
+        if len(summaries) == 0:
+            print("No tables with orders match.")
+            return
+        rows = []
+        for summary in summaries:
+            plural = "" if summary.orders == 1 else "s"
+            rows.append(
+                [
+                    f" * {summary.id}",
+                    f"{summary.orders} order{plural}",
+                    f"{Util.format_cents(summary.amount)} EUR",
+                ]
+            )
+        print("Tables:")
+        yield from Util.page(Util.column_align_lines(rows, sep="  "))
+        total = sum(summary.amount for summary in summaries)
+        print(f"Total: {Util.format_cents(total)} EUR")
+        print()
+        print(
+            f"Delete {len(summaries)} table(s) and save the invoices to file?"
+        )
+        print("  y: Confirm")
+        print("  n: Cancel (default)")
+        if (yield "Selection [yN]: ").lower() != "y":
+            return
+        tables = []
+        for summary in summaries:
+            if self.tables.summary(summary.id) is summary:
+                tables.append(self.tables[summary.id])
+            else:
+                # Only possible when serving several terminals.
+                print(f"Table {summary.id} was closed meanwhile.")
+        invoices = [table.invoice(now) for table in tables]
+        try:
+            self.invoice_sink.write_many(invoices)
+            self.invoice_sink.flush()
+        except Exception as e:
+            print(f"Error: invoice-all: saving the invoices failed: {e}.")
+            print("No table was deleted.")
+            return
+        self.remove_tables([table.id for table in tables])
+        if self.curr_table is not None and self.curr_table not in self.tables:
+            self.curr_table = None
+            self.set_prompt_prefix([])
+        print(
+            f"Saved the orders of {len(tables)} table(s) to \
+{self.invoice_sink.name()} and deleted them from memory."
+        )
+
     app.add_command(
         shell.Command(
             "table",
@@ -329,21 +1867,16 @@ to list orders.'
         shell.Command(
             "list",
             "list available food items and their IDs",
-            [shell.StringParam("filter", optional=True)],
+            [shell.StringParam("filter", optional=True, rest=True)],
             cmd_list,
+            aliases=["menu"],
         )
     )
     app.add_command(
         shell.Command(
             "order",
             "place an order for the current table",
-            [
-                shell.IntParam(
-                    "item_id",
-                    min=1,
-                    max=len(app.food_items),
-                )
-            ],
+            [FoodItemParam("item", lambda: app.food_items)],
             cmd_order,
         )
     )
@@ -351,7 +1884,7 @@ to list orders.'
         shell.Command(
             "orders",
             "list current table's orders",
-            [],
+            [shell.ChoiceParam("view", ["all", "live"], optional=True)],
             cmd_orders,
         )
     )
@@ -363,6 +1896,36 @@ to list orders.'
             cmd_rescind,
         )
     )
+    app.add_command(
+        shell.Command(
+            "recent",
+            "list all tables' orders of the last minutes (default 15)",
+            [shell.IntParam("minutes", optional=True, min=1)],
+            cmd_recent,
+        )
+    )
+    app.add_command(
+        shell.Command(
+            "idle",
+            "list tables without orders in the last minutes (default 60)",
+            [shell.IntParam("minutes", optional=True, min=1)],
+            cmd_idle,
+        )
+    )
+    app.add_command(
+        shell.Command(
+            "top",
+            "list the best selling items, types or categories",
+            [
+                shell.ChoiceParam(
+                    "group", SalesCounters.GROUPS, optional=True
+                ),
+                shell.IntParam("n", optional=True, min=1),
+                shell.ChoiceParam("by", ["revenue", "sold"], optional=True),
+            ],
+            cmd_top,
+        )
+    )
     app.add_command(
         shell.Command(
             "invoice",
@@ -371,9 +1934,240 @@ to list orders.'
             cmd_invoice,
         )
     )
+    app.add_command(
+        shell.Command(
+            "invoice-all",
+            "invoice and delete all tables matching the filter at once",
+            [shell.StringParam("filter", optional=True, rest=True)],
+            cmd_invoice_all,
+        )
+    )
+    if stats is not None:
+        app.enable_stats(stats)
+    return app
+
+
+def run(
+    debug: bool = False,
+    compact_menu: bool = False,
+    journal_dir: str | None = None,
+    invoice_sink: "InvoiceSink | None" = None,
+    batch_filename: str | None = None,
+    confirm: str = "inline",
+    stats: bool = False,
+    stats_filename: str | None = None,
+    stats_interval: float = 10,
+    watch_menu: float | None = None,
+    menu_cache: bool = True,
+    shared_menu: str | None = None,
+    table_budget: int | None = None,
+    spill_dir: str | None = None,
+):
+    """Use to run the full project. With batch_filename set, the
+    commands are read from that file ("-" for stdin) instead. With
+    stats set, command latencies are recorded and, if stats_filename
+    is given, written to it every stats_interval seconds. With
+    watch_menu set, the menu is reloaded when food.csv changes,
+    checking every watch_menu seconds. The parsed menu is cached
+    unless menu_cache is False. With shared_menu set, the menu
+    published under that name is used instead, see sharedmenu.py.
+    With table_budget set, tables beyond that many bytes are spilled
+    to spill_dir."""
+    app_stats = None
+    if stats or stats_filename is not None:
+        from stats import Stats
+
+        app_stats = Stats()
+    app = create_app(
+        debug=debug,
+        compact_menu=compact_menu,
+        journal_dir=journal_dir,
+        invoice_sink=invoice_sink,
+        stats=app_stats,
+        menu_cache=menu_cache,
+        shared_menu=shared_menu,
+        table_budget=table_budget,
+        spill_dir=spill_dir,
+    )
+    if len(app.tables) > 0:
+        print(f"Restored {len(app.tables)} open table(s) from the journal.")
+    if watch_menu is not None:
+        app.watch_menu(watch_menu)
+    dumper = None
+    if stats_filename is not None:
+        from stats import StatsDumper
 
-    app.run("Welcome to the RESTAURANT SHELL 9000!")
+        dumper = StatsDumper(app_stats, stats_filename, stats_interval)
+    try:
+        if batch_filename is None:
+            app.run(WELCOME)
+        elif batch_filename == "-":
+            count, seconds = app.run_batch(sys.stdin, confirm)
+        else:
+            with open(batch_filename, "r") as f:
+                count, seconds = app.run_batch(f, confirm)
+    finally:
+        app.close()
+        if dumper is not None:
+            dumper.close()
+    if batch_filename is not None:
+        rate = count / seconds if seconds > 0 else float("inf")
+        print(
+            f"Ran {count} commands in {seconds:.3f} s \
+({rate:.0f} commands/s).",
+            file=sys.stderr,
+        )
 
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="Restaurant shell")
+    parser.add_argument(
+        "--debug",
+        action="store_true",
+        help="check running totals against a full recompute",
+    )
+    parser.add_argument(
+        "--compact-menu",
+        action="store_true",
+        help="store the menu column-wise to save memory",
+    )
+    parser.add_argument(
+        "--watch-menu",
+        type=float,
+        nargs="?",
+        const=1.0,
+        metavar="SECONDS",
+        help="reload the menu when food.csv changes, checking every \
+SECONDS (default 1)",
+    )
+    parser.add_argument(
+        "--no-menu-cache",
+        action="store_true",
+        help="always parse food.csv instead of using food.csv.cache",
+    )
+    parser.add_argument(
+        "--shared-menu",
+        metavar="NAME",
+        help="use the menu published by sharedmenu.py under NAME instead \
+of food.csv",
+    )
+    parser.add_argument(
+        "--journal",
+        metavar="DIR",
+        help="journal open tables to DIR and restore them on start",
+    )
+    parser.add_argument(
+        "--table-budget",
+        type=float,
+        metavar="MB",
+        help="keep at most MB of tables in memory, spilling the least \
+recently used ones to disk",
+    )
+    parser.add_argument(
+        "--table-spill-dir",
+        metavar="DIR",
+        help="spill tables to DIR (default: a temporary directory)",
+    )
+    parser.add_argument(
+        "--invoice-flush-count",
+        type=int,
+        default=1,
+        metavar="N",
+        help="write invoices to disk every N invoices",
+    )
+    parser.add_argument(
+        "--invoice-flush-interval",
+        type=float,
+        metavar="SECONDS",
+        help="also write buffered invoices after SECONDS",
+    )
+    parser.add_argument(
+        "--invoice-fsync",
+        action="store_true",
+        help="sync invoices to disk on every write",
+    )
+    parser.add_argument(
+        "--invoice-rotate-daily",
+        action="store_true",
+        help="write invoices to one file per day",
+    )
+    parser.add_argument(
+        "--invoice-max-bytes",
+        type=int,
+        metavar="N",
+        help="start a new invoice file once it reaches N bytes",
+    )
+    parser.add_argument(
+        "--invoice-archive",
+        metavar="DIR",
+        help="write invoices to an indexed binary archive in DIR instead \
+(query it with archive.py)",
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="FILE",
+        help='run the commands in FILE ("-" for stdin) without prompts',
+    )
+    parser.add_argument(
+        "--confirm",
+        choices=["inline", "yes", "default"],
+        default="inline",
+        help="in batch mode, read confirmations from the next line, \
+always confirm or always take the default",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help='record command latencies, shown by the "stats" command',
+    )
+    parser.add_argument(
+        "--stats-file",
+        metavar="FILE",
+        help="periodically write command statistics to FILE in the \
+Prometheus text format (implies --stats)",
+    )
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=10,
+        metavar="SECONDS",
+        help="write the statistics file every SECONDS",
+    )
+    args = parser.parse_args()
+    from invoices import FileInvoiceSink, ThreadedInvoiceSink
+
+    if args.invoice_archive is not None:
+        from archive import ArchiveInvoiceSink
+
+        invoice_sink = ArchiveInvoiceSink(
+            args.invoice_archive, fsync=args.invoice_fsync
+        )
+    else:
+        invoice_sink = FileInvoiceSink(
+            "invoices.txt",
+            flush_count=args.invoice_flush_count,
+            flush_interval=args.invoice_flush_interval,
+            fsync=args.invoice_fsync,
+            rotate_daily=args.invoice_rotate_daily,
+            max_bytes=args.invoice_max_bytes,
+        )
+    run(
+        debug=args.debug,
+        compact_menu=args.compact_menu,
+        journal_dir=args.journal,
+        invoice_sink=ThreadedInvoiceSink(invoice_sink),
+        batch_filename=args.batch,
+        confirm=args.confirm,
+        stats=args.stats,
+        stats_filename=args.stats_file,
+        stats_interval=args.stats_interval,
+        watch_menu=args.watch_menu,
+        menu_cache=not args.no_menu_cache,
+        shared_menu=args.shared_menu,
+        table_budget=(
+            None
+            if args.table_budget is None
+            else int(args.table_budget * 1e6)
+        ),
+        spill_dir=args.table_spill_dir,
+    )
@@ -0,0 +1,265 @@
+__author__ = "8030456, Schuppan, 8404886, Kraus"
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+from util import Util
+
+
+def intersect(a, b) -> list[int]:
+    """Returns the numbers in both ascending sequences, looking up
+    each number of the shorter one in the longer one by bisection.
+
+    >>> intersect([1, 4, 7, 9], range(0, 10, 2))
+    [4]
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    res = []
+    lo = 0
+    for x in a:
+        lo = bisect_left(b, x, lo)
+        if lo == len(b):
+            break
+        if b[lo] == x:
+            res.append(x)
+    return res
+
+
+class SearchIndex:
+    """Inverted trigram index over food item names. Supports substring
+    terms and facets like "type:drink category:vegan price<10".
+
+    A term matches an item if it is part of its name, its type or its
+    categories. Terms contain no spaces, so they never span two of
+    these. Types and categories only come in a few combinations, which
+    are searched directly."""
+
+    # Length of the n-grams in the index. Longer terms intersect their
+    # n-grams, shorter ones scan the names.
+    N = 3
+
+    def __init__(self, items) -> None:
+        self.__names: list[str] = []
+        # Postings are arrays of item IDs in ascending order.
+        self.__grams: dict[str, array] = {}
+        # Items by "type category,..." text.
+        self.__tails: dict[str, array] = {}
+        self.__types: dict[str, array] = {}
+        self.__categories: dict[str, array] = {}
+        # (price, id) pairs sorted by price for range lookups.
+        self.__prices: list[tuple[int, int]] = []
+        grams = self.__grams
+        n = self.N
+        for i, item in enumerate(items):
+            name = item.name.lower()
+            self.__names.append(name)
+            for gram in {name[j : j + n] for j in range(len(name) - n + 1)}:
+                postings = grams.get(gram)
+                if postings is None:
+                    postings = grams[gram] = array("l")
+                postings.append(i)
+            tail = f"{item.type} {','.join(sorted(item.categories))}"
+            self.__tails.setdefault(tail.lower(), array("l")).append(i)
+            self.__types.setdefault(item.type.lower(), array("l")).append(i)
+            for cat in item.categories:
+                cats = self.__categories.setdefault(cat.lower(), array("l"))
+                cats.append(i)
+            self.__prices.append((item.price, i))
+        self.__prices.sort()
+
+    def __len__(self) -> int:
+        return len(self.__names)
+
+    @staticmethod
+    def is_facet(term: str) -> bool:
+        """Returns if a query term filters by type, category or price
+        rather than matching text."""
+        return term.lower().startswith(("type:", "category:", "cat:", "price"))
+
+    def search(self, query: str | None) -> list[int]:
+        """Returns the IDs of all items matching every term of
+        the query in ascending order. Raises a ValueError if the
+        query is malformed."""
+        if query is None or query.strip() == "":
+            return list(range(len(self)))
+        postings = []
+        for term in query.lower().split():
+            if term.startswith("type:"):
+                postings.append(
+                    self.__types.get(term.removeprefix("type:"), ())
+                )
+            elif term.startswith("category:") or term.startswith("cat:"):
+                cat = term.split(":", 1)[1]
+                postings.append(self.__categories.get(cat, ()))
+            elif term.startswith("price"):
+                postings.append(self.__price_range(term))
+            else:
+                postings.append(self.__substring(term))
+        postings.sort(key=len)
+        res = postings[0]
+        for p in postings[1:]:
+            if len(res) == 0:
+                break
+            res = intersect(res, p)
+        return list(res)
+
+    def __substring(self, term: str) -> list[int]:
+        """Returns the IDs of the items containing term."""
+        names = self.__names
+        n = self.N
+        if len(term) < n:
+            ids = [i for i, name in enumerate(names) if term in name]
+        else:
+            grams = sorted(
+                (
+                    self.__grams.get(term[j : j + n], ())
+                    for j in range(len(term) - n + 1)
+                ),
+                key=len,
+            )
+            ids = grams[0]
+            for g in grams[1:]:
+                if len(ids) == 0:
+                    break
+                ids = intersect(ids, g)
+            if len(term) > n:
+                # Trigrams only yield candidates for longer terms.
+                ids = [i for i in ids if term in names[i]]
+        tails = [ids for tail, ids in self.__tails.items() if term in tail]
+        if len(tails) == 0:
+            return ids
+        return sorted(set(ids).union(*tails))
+
+    def __price_range(self, term: str) -> list[int]:
+        for op in ["<=", ">=", "<", ">", "="]:
+            if term.startswith("price" + op):
+                val = term.removeprefix("price" + op)
+                break
+        else:
+            raise ValueError(f'invalid price filter "{term}"')
+        try:
+            cents = Util.parse_cents(val)
+        except ValueError:
+            raise ValueError(f'invalid price "{val}"')
+        if op == "<":
+            lo, hi = 0, bisect_left(self.__prices, (cents, -1))
+        elif op == "<=":
+            lo, hi = 0, bisect_right(self.__prices, (cents, len(self)))
+        elif op == ">":
+            lo = bisect_right(self.__prices, (cents, len(self)))
+            hi = len(self.__prices)
+        elif op == ">=":
+            lo, hi = bisect_left(self.__prices, (cents, -1)), len(self)
+        else:
+            lo = bisect_left(self.__prices, (cents, -1))
+            hi = bisect_right(self.__prices, (cents, len(self)))
+        return sorted(i for _, i in self.__prices[lo:hi])
+
+
+class FuzzyIndex:
+    """Typo-tolerant index over the words of food item names. Words
+    are compared by their trigrams, the best candidates also by edit
+    distance, so "mozzarella" finds "Pizza Mozarella"."""
+
+    # Minimum similarity (0 to 1) of a word to count as a match.
+    THRESHOLD = 0.4
+    # Most words per query word compared by edit distance, the ones
+    # sharing the most trigrams. Bounds the time of vague queries.
+    MAX_EDIT_CANDIDATES = 1000
+
+    def __init__(self, items) -> None:
+        self.__words: list[str] = []
+        self.__word_ids: dict[str, int] = {}
+        # Items containing each word.
+        self.__word_items: list[list[int]] = []
+        # Words containing each trigram.
+        self.__grams: dict[str, list[int]] = {}
+        for i, item in enumerate(items):
+            for word in set(self.words(item.name)):
+                w = self.__word_ids.get(word)
+                if w is None:
+                    w = len(self.__words)
+                    self.__word_ids[word] = w
+                    self.__words.append(word)
+                    self.__word_items.append([])
+                    for gram in self.trigrams(word):
+                        self.__grams.setdefault(gram, []).append(w)
+                self.__word_items[w].append(i)
+
+    @staticmethod
+    def words(text: str) -> list[str]:
+        """Splits text into lowercase alphanumeric words."""
+        return "".join(c if c.isalnum() else " " for c in text.lower()).split()
+
+    @staticmethod
+    def trigrams(word: str) -> set[str]:
+        """Returns the trigrams of a word padded with spaces, so short
+        words and word starts count too."""
+        padded = f"  {word} "
+        return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+    @staticmethod
+    def distance(a: str, b: str) -> int:
+        """Returns the Levenshtein distance of a and b.
+
+        >>> FuzzyIndex.distance("pfirsch", "pfirsich")
+        1
+        """
+        prev = list(range(len(b) + 1))
+        for i, ca in enumerate(a, 1):
+            cur = [i]
+            for j, cb in enumerate(b, 1):
+                cur.append(
+                    min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+                )
+            prev = cur
+        return prev[-1]
+
+    def similar_words(self, word: str) -> dict[int, float]:
+        """Returns the IDs of indexed words similar to word with their
+        similarity from 0 to 1, 1 meaning equal."""
+        grams = self.trigrams(word)
+        shared: dict[int, int] = {}
+        for gram in grams:
+            for w in self.__grams.get(gram, ()):
+                shared[w] = shared.get(w, 0) + 1
+        candidates = sorted(shared.items(), key=lambda c: -c[1])
+        res = {}
+        for rank, (w, n) in enumerate(candidates):
+            other = self.__words[w]
+            # Dice coefficient of the trigram sets.
+            sim = 2 * n / (len(grams) + len(other) + 1)
+            if sim < self.THRESHOLD / 2:
+                continue
+            if other.startswith(word):
+                # Typing the start of a word is no typo.
+                sim = max(sim, 0.5 + 0.5 * len(word) / len(other))
+            elif sim < 1 and rank < self.MAX_EDIT_CANDIDATES:
+                edits = self.distance(word, other)
+                sim = max(sim, 1 - edits / max(len(word), len(other)))
+            if sim >= self.THRESHOLD:
+                res[w] = sim
+        return res
+
+    def search(self, query: str) -> list[tuple[int, float]]:
+        """Returns (item ID, score) pairs of the items whose names are
+        similar to the query, best first. The score is the mean
+        similarity of each query word to the item's best matching
+        word."""
+        words = self.words(query)
+        if len(words) == 0:
+            return []
+        scores: dict[int, float] = {}
+        for word in words:
+            best: dict[int, float] = {}
+            for w, sim in self.similar_words(word).items():
+                for i in self.__word_items[w]:
+                    if sim > best.get(i, 0):
+                        best[i] = sim
+            for i, sim in best.items():
+                scores[i] = scores.get(i, 0) + sim
+        return sorted(
+            ((i, score / len(words)) for i, score in scores.items()),
+            key=lambda r: (-r[1], r[0]),
+        )
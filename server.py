@@ -0,0 +1,336 @@
+__author__ = "8030456, Schuppan, 8404886, Kraus"
+
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import io
+import os
+import sys
+import threading
+import time
+
+from invoices import FileInvoiceSink
+import main
+from stats import Stats
+
+# Session whose output print() currently goes to, set per worker thread.
+_current_session = contextvars.ContextVar("current_session", default=None)
+
+
+class _SessionStdout(io.TextIOBase):
+    """Replaces sys.stdout, sending output to the current session, or
+    to the real stdout outside of sessions."""
+
+    def __init__(self, stdout) -> None:
+        self.__stdout = stdout
+
+    def write(self, s: str) -> int:
+        session = _current_session.get()
+        if session is None:
+            return self.__stdout.write(s)
+        session.output.append(s)
+        return len(s)
+
+    def flush(self) -> None:
+        if _current_session.get() is None:
+            self.__stdout.flush()
+
+
+class Session:
+    """State of one terminal connection. The current table and prompt
+    are per session, everything else is looked up on the shared App.
+    Commands get the session as self."""
+
+    def __init__(self, server: "Server", writer: asyncio.StreamWriter):
+        self.__server = server
+        self.__writer = writer
+        self.__prompt_elems: list[str] = []
+        # Lines received but not yet consumed, None on disconnect.
+        self.lines: asyncio.Queue[str | None] = asyncio.Queue()
+        self.output: list[str] = []
+        self.curr_table = None
+        # The command waiting for an answer, see step().
+        self.__steps = None
+
+    def __getattr__(self, name: str):
+        return getattr(self.__server.app, name)
+
+    def set_prompt_prefix(self, elems: list[str]) -> None:
+        self.__prompt_elems = elems
+
+    def prompt(self) -> str:
+        return " ".join(self.__prompt_elems + [">> "])
+
+    def send(self, s: str = "") -> None:
+        """Sends the buffered output followed by s. Safe to call from
+        worker threads."""
+        self.output.append(s)
+        data = "".join(self.output).encode()
+        self.output.clear()
+        self.__server.loop.call_soon_threadsafe(self.__writer.write, data)
+
+    def step(self, line: str) -> str | None:
+        """Runs a command line, or passes line to the command waiting
+        for an answer, on a worker thread until the command finishes
+        or asks for the next answer. Returns the prompt to send next,
+        or None if the session should end. Nothing holds a thread
+        while the terminal answers."""
+        token = _current_session.set(self)
+        try:
+            with self.__server.lock:
+                try:
+                    if self.__steps is None:
+                        self.__steps = self.__server.app.execute_steps(
+                            line, self
+                        )
+                        return next(self.__steps)
+                    return self.__steps.send(line)
+                except StopIteration as e:
+                    self.__steps = None
+                    return self.prompt() if e.value else None
+                except BaseException:
+                    self.__steps = None
+                    raise
+        finally:
+            _current_session.reset(token)
+
+    def close(self) -> None:
+        """Abandons the command waiting for an answer, if any."""
+        if self.__steps is not None:
+            with self.__server.lock:
+                self.__steps.close()
+            self.__steps = None
+
+
+class Server:
+    """Serves many terminals against one shared App. Connections are
+    handled by asyncio, commands run on a small pool of worker threads
+    holding the App's lock. A command waiting for an answer from its
+    terminal is suspended (see shell.Command) and holds no thread, so
+    any number of terminals may sit at a prompt."""
+
+    def __init__(self, app: main.App, workers: int = 8) -> None:
+        self.app = app
+        self.lock = threading.Lock()
+        self.loop = None
+        self.__pool = ThreadPoolExecutor(workers)
+        self.sessions = 0
+
+    async def serve(self, host: str, port: int) -> None:
+        """Serves connections until cancelled."""
+        self.loop = asyncio.get_running_loop()
+        sys.stdout = _SessionStdout(sys.stdout)
+        server = await asyncio.start_server(
+            self.__handle, host, port, backlog=1024
+        )
+        async with server:
+            await server.serve_forever()
+
+    async def __handle(self, reader, writer) -> None:
+        session = Session(self, writer)
+        self.sessions += 1
+
+        async def read_lines():
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    session.lines.put_nowait(line.decode().rstrip("\r\n"))
+            except ConnectionError:
+                pass
+            session.lines.put_nowait(None)
+
+        reading = asyncio.create_task(read_lines())
+        try:
+            session.send(
+                f'{main.WELCOME}\nType "help" for a list of commands.\n'
+                + session.prompt()
+            )
+            while True:
+                line = await session.lines.get()
+                if line is None:
+                    break
+                prompt = await self.loop.run_in_executor(
+                    self.__pool, session.step, line
+                )
+                if prompt is None:
+                    session.send()
+                    break
+                session.send(prompt)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions -= 1
+            reading.cancel()
+            await self.loop.run_in_executor(self.__pool, session.close)
+            writer.close()
+
+
+async def load_test(
+    host: str, port: int, clients: int, rounds: int, think: float = 0.0
+) -> None:
+    """Connects clients simulated terminals which each open a table,
+    place and rescind orders and list them rounds times, then invoice
+    the table. With think > 0, the terminals wait think seconds at
+    each prompt before answering, which isn't counted as latency.
+    Prints throughput and latency percentiles."""
+    latencies = []
+
+    async def client(i: int) -> None:
+        reader, writer = await asyncio.open_connection(host, port)
+
+        async def command(lines: list[str]) -> None:
+            start = time.perf_counter()
+            if think > 0:
+                writer.write(f"{lines[0]}\n".encode())
+                for line in lines[1:]:
+                    # Only used with "Selection [...]: " prompts.
+                    await reader.readuntil(b"]: ")
+                    await asyncio.sleep(think)
+                    writer.write(f"{line}\n".encode())
+            else:
+                writer.write("".join(line + "\n" for line in lines).encode())
+            await reader.readuntil(b">> ")
+            latencies.append(
+                time.perf_counter() - start - think * (len(lines) - 1)
+            )
+
+        await reader.readuntil(b">> ")
+        await command([f"table load-{i}"])
+        for j in range(rounds):
+            if think > 0:
+                await command([f"order {j % 18 + 1}", "y"])
+                await command(["tables"])
+            else:
+                await command(
+                    [f"order {j % 18 + 1}", "s", "no ice", "n", "y"]
+                )
+            await command([f"rescind {2 * j + 1}"])
+            await command(["orders"])
+        await command(["invoice", "y"])
+        writer.write(b"exit\n")
+        await writer.drain()
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(clients)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    def percentile(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+    print(
+        f"{clients} clients, {len(latencies)} commands in {elapsed:.2f} s "
+        f"({len(latencies) / elapsed:.0f} commands/s)"
+    )
+    print(
+        f"latency p50 {percentile(0.5) * 1000:.2f} ms, "
+        f"p95 {percentile(0.95) * 1000:.2f} ms, "
+        f"p99 {percentile(0.99) * 1000:.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve the restaurant shell to network terminals"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8023)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="threads executing commands",
+    )
+    parser.add_argument(
+        "--load-test",
+        type=int,
+        metavar="CLIENTS",
+        help="run a local server and CLIENTS simulated terminals against it",
+    )
+    parser.add_argument(
+        "--rounds",
+        type=int,
+        default=20,
+        help="orders per simulated terminal in the load test",
+    )
+    parser.add_argument(
+        "--think",
+        type=float,
+        default=0.0,
+        metavar="SECONDS",
+        help="in the load test, wait SECONDS at each prompt before answering",
+    )
+    parser.add_argument("--journal", metavar="DIR")
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help='record command latencies, shown by the "stats" command',
+    )
+    parser.add_argument(
+        "--watch-menu",
+        type=float,
+        nargs="?",
+        const=1.0,
+        metavar="SECONDS",
+        help="reload the menu when food.csv changes",
+    )
+    parser.add_argument(
+        "--shared-menu",
+        metavar="NAME",
+        help="use the menu published by sharedmenu.py under NAME",
+    )
+    parser.add_argument(
+        "--table-budget",
+        type=float,
+        metavar="MB",
+        help="keep at most MB of tables in memory, spilling the rest",
+    )
+    parser.add_argument("--table-spill-dir", metavar="DIR")
+    args = parser.parse_args()
+
+    invoice_sink = None
+    if args.load_test is not None:
+        # Keep load test invoices out of the real archive.
+        invoice_sink = FileInvoiceSink(os.devnull)
+    app = main.create_app(
+        journal_dir=args.journal,
+        invoice_sink=invoice_sink,
+        stats=Stats() if args.stats else None,
+        shared_menu=args.shared_menu,
+        table_budget=(
+            None
+            if args.table_budget is None
+            else int(args.table_budget * 1e6)
+        ),
+        spill_dir=args.table_spill_dir,
+    )
+    if args.watch_menu is not None:
+        app.watch_menu(args.watch_menu)
+    server = Server(app, args.workers)
+
+    async def load() -> None:
+        serving = asyncio.create_task(server.serve(args.host, args.port))
+        await asyncio.sleep(0.1)
+        try:
+            await load_test(
+                args.host, args.port, args.load_test, args.rounds, args.think
+            )
+            while server.sessions > 0:
+                await asyncio.sleep(0.01)
+        finally:
+            serving.cancel()
+
+    try:
+        if args.load_test is None:
+            asyncio.run(server.serve(args.host, args.port))
+        else:
+            asyncio.run(load())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        app.close()
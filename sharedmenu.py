@@ -0,0 +1,284 @@
+__author__ = "8030456, Schuppan, 8404886, Kraus"
+
+import argparse
+from array import array
+from collections.abc import Sequence
+from multiprocessing import resource_tracker, shared_memory
+import struct
+import sys
+import time
+
+# Magic, layout version, number of items, strings, category sets and
+# category set members. The sections follow in this order, each
+# starting at a multiple of 8 bytes:
+#   prices      "q" per item, in cents
+#   names       "I" per item, string number
+#   types       "I" per item, string number
+#   categories  "I" per item, category set number
+#   strings     "Q" offset per string and one past the end
+#   sets        "I" offset per category set and one past the end
+#   members     "I" string number per category of each set
+#   string data UTF-8
+HEADER = struct.Struct("<4sIIIII")
+MAGIC = b"RSM1"
+VERSION = 1
+# Names of the menus published by this process.
+_published: set[str] = set()
+
+
+def _align(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def _sections(items: int, strings: int, sets: int, members: int):
+    """Returns the offset of each section and the total size without
+    the string data."""
+    sizes = [
+        8 * items,
+        4 * items,
+        4 * items,
+        4 * items,
+        8 * (strings + 1),
+        4 * (sets + 1),
+        4 * members,
+    ]
+    offsets = []
+    pos = _align(HEADER.size)
+    for size in sizes:
+        offsets.append(pos)
+        pos = _align(pos + size)
+    return offsets, pos
+
+
+class _Column(Sequence):
+    """Read-only view of a column of string or category set numbers,
+    resolving them with lookup. Distinct values are few, so each is
+    only created once."""
+
+    def __init__(self, ids: memoryview, lookup) -> None:
+        self.__ids = ids
+        self.__lookup = lookup
+        self.__values = {}
+
+    def __len__(self) -> int:
+        return len(self.__ids)
+
+    def __getitem__(self, i: int):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        n = self.__ids[i]
+        value = self.__values.get(n)
+        if value is None:
+            value = self.__lookup(n)
+            self.__values[n] = value
+        return value
+
+
+class _NameColumn(Sequence):
+    """Read-only view of the name column. Names are mostly distinct,
+    so they are decoded on every access instead of being kept."""
+
+    def __init__(self, ids: memoryview, lookup) -> None:
+        self.__ids = ids
+        self.__lookup = lookup
+
+    def __len__(self) -> int:
+        return len(self.__ids)
+
+    def __getitem__(self, i: int) -> str:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self.__lookup(self.__ids[i])
+
+
+class SharedMenu:
+    """A menu in a shared memory segment, created by publish. Other
+    processes attach to it by name, see FoodItems.attach. The columns
+    are read directly from the segment, nothing is copied or parsed.
+
+    close() only succeeds once nothing uses the columns anymore.
+    Only the publishing process should unlink() the segment."""
+
+    def __init__(self, name: str) -> None:
+        """Attaches to the menu published under name. Raises a
+        FileNotFoundError if there is none, or a ValueError if the
+        segment doesn't hold a menu."""
+        try:
+            shm = shared_memory.SharedMemory(name, track=False)
+        except TypeError:
+            # Before Python 3.13, attaching registers the segment for
+            # removal when this process exits.
+            shm = shared_memory.SharedMemory(name)
+            if name not in _published:
+                resource_tracker.unregister(shm._name, "shared_memory")
+        self.__open(shm)
+
+    @staticmethod
+    def _owned(shm: shared_memory.SharedMemory) -> "SharedMenu":
+        menu = SharedMenu.__new__(SharedMenu)
+        menu.__open(shm)
+        return menu
+
+    def __open(self, shm: shared_memory.SharedMemory) -> None:
+        self.__shm = shm
+        self.__buf = shm.buf.toreadonly()
+        magic, version, items, strings, sets, members = HEADER.unpack_from(
+            self.__buf
+        )
+        if magic != MAGIC or version != VERSION:
+            self.__buf.release()
+            shm.close()
+            raise ValueError(f'"{shm.name}" is no published menu')
+        offsets, data_start = _sections(items, strings, sets, members)
+        counts = [
+            items,
+            items,
+            items,
+            items,
+            strings + 1,
+            sets + 1,
+            members,
+        ]
+        self.__views = [
+            self.__buf[off : off + count * struct.calcsize(fmt)].cast(fmt)
+            for off, count, fmt in zip(offsets, counts, "qIIIQII")
+        ]
+        prices, names, types, cats, strings, sets, members = self.__views
+        data = self.__buf[data_start:]
+        self.__views.append(data)
+
+        # The columns must not refer back to self: without a reference
+        # cycle, self is finalized before the SharedMemory, see __del__.
+        def string(n: int) -> str:
+            return str(data[strings[n] : strings[n + 1]], "utf-8")
+
+        self.prices = prices
+        self.names = _NameColumn(names, string)
+        self.types = _Column(types, lambda n: sys.intern(string(n)))
+        self.categories = _Column(
+            cats,
+            lambda n: frozenset(
+                sys.intern(string(m))
+                for m in members[sets[n] : sets[n + 1]]
+            ),
+        )
+
+    @property
+    def name(self) -> str:
+        return self.__shm.name
+
+    @property
+    def size(self) -> int:
+        return self.__shm.size
+
+    def close(self) -> None:
+        """Detaches from the segment."""
+        for view in self.__views:
+            view.release()
+        self.__buf.release()
+        self.__shm.close()
+
+    def __del__(self) -> None:
+        # SharedMemory can't unmap the segment while views exist.
+        if hasattr(self, "_SharedMenu__views"):
+            self.close()
+
+    def unlink(self) -> None:
+        """Removes the segment once all processes detached."""
+        self.__shm.unlink()
+
+
+def publish(food_items, name: str | None = None) -> SharedMenu:
+    """Publishes a menu (a main.FoodItems) to a new shared memory
+    segment, named name or a random name. Returns it attached; the
+    caller owns it and should unlink() it when done."""
+    strings: dict[str, int] = {}
+    data = []
+    offsets = array("Q", [0])
+
+    def string(s: str) -> int:
+        n = strings.get(s)
+        if n is None:
+            n = len(strings)
+            strings[s] = n
+            data.append(s.encode())
+            offsets.append(offsets[-1] + len(data[-1]))
+        return n
+
+    sets: dict[frozenset[str], int] = {}
+    set_offsets = array("I", [0])
+    members = array("I")
+    prices = array("q")
+    names = array("I")
+    types = array("I")
+    cats = array("I")
+    for item in food_items:
+        prices.append(item.price)
+        names.append(string(item.name))
+        types.append(string(item.type))
+        n = sets.get(item.categories)
+        if n is None:
+            n = len(sets)
+            sets[item.categories] = n
+            members.extend(string(c) for c in sorted(item.categories))
+            set_offsets.append(len(members))
+        cats.append(n)
+
+    items = len(prices)
+    section_offsets, data_start = _sections(
+        items, len(strings), len(sets), len(members)
+    )
+    blob = b"".join(data)
+    shm = shared_memory.SharedMemory(
+        name, create=True, size=max(data_start + len(blob), 1)
+    )
+    try:
+        buf = shm.buf
+        HEADER.pack_into(
+            buf,
+            0,
+            MAGIC,
+            VERSION,
+            items,
+            len(strings),
+            len(sets),
+            len(members),
+        )
+        columns = [prices, names, types, cats, offsets, set_offsets, members]
+        for off, column in zip(section_offsets, columns):
+            raw = column.tobytes()
+            buf[off : off + len(raw)] = raw
+        buf[data_start : data_start + len(blob)] = blob
+        del buf
+        _published.add(shm.name)
+        return SharedMenu._owned(shm)
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Publish the menu to shared memory for other processes \
+(main.py --shared-menu NAME) until interrupted"
+    )
+    parser.add_argument("menu", nargs="?", default="food.csv")
+    parser.add_argument("--name", default="restaurant-menu")
+    args = parser.parse_args()
+
+    from main import FoodItems
+
+    menu = publish(FoodItems(args.menu, compact=True), args.name)
+    print(
+        f"Published {len(menu.prices)} food items ({menu.size} bytes) "
+        f'as "{menu.name}". Press ctrl+c to stop.'
+    )
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        menu.close()
+        menu.unlink()
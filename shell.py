@@ -1,9 +1,13 @@
 __author__ = "8030456, Schuppan, 8404886, Kraus"
 
 from dataclasses import dataclass, field
-from enum import Enum
 from typing import Callable
 from abc import ABC, abstractmethod
+import contextlib
+import io
+import sys
+import time
+import types
 
 from util import Util
 
@@ -31,13 +35,22 @@ class Param(ABC):
     def parse(self, val: str) -> object:
         pass
 
+    def rest(self) -> bool:
+        """Checking if the Parameter takes all remaining words
+            True -> takes the rest of the line,
+            False -> takes a single word"""
+        return False
+
 
 class StringParam(Param):
     """Class to handle string parameters.
        Inherits from the Class Param"""
-    def __init__(self, name: str, optional: bool = False) -> None:
+    def __init__(
+        self, name: str, optional: bool = False, rest: bool = False
+    ) -> None:
         self.__name = name
         self.__optional = optional
+        self.__rest = rest
 
     def optional(self) -> str:
         """Returns if the string parameter is optional"""
@@ -48,11 +61,15 @@ class StringParam(Param):
         return self.__name
 
     def constraints(self):
-        return "string"
+        return "string..." if self.__rest else "string"
 
     def parse(self, val: str) -> str:
         return val
 
+    def rest(self) -> bool:
+        """Returns if the string parameter takes the rest of the line"""
+        return self.__rest
+
 
 class IntParam(Param):
     """Class to handle Integer parameter.
@@ -62,13 +79,20 @@ class IntParam(Param):
         name: str,
         optional: bool = False,
         min: int | None = None,
-        max: int | None = None,
+        max: int | Callable[[], int] | None = None,
     ) -> None:
+        """max may be a function returning the current maximum, for
+        bounds which change at runtime."""
         self.__name = name
         self.__optional = optional
         self.__min = min
         self.__max = max
 
+    def __get_max(self) -> int | None:
+        if callable(self.__max):
+            return self.__max()
+        return self.__max
+
     def optional(self) -> str:
         """Returns if the Integer parameter is optional"""
         return self.__optional
@@ -84,8 +108,9 @@ class IntParam(Param):
         res = "int"
         if self.__min is not None:
             res += f" from {self.__min}"
-        if self.__max is not None:
-            res += f" to {self.__max}"
+        max = self.__get_max()
+        if max is not None:
+            res += f" to {max}"
         return res
 
     def parse(self, val: str) -> float:
@@ -102,22 +127,128 @@ class IntParam(Param):
                 raise ValueError(
                     f"expected number to be at least {self.__min}"
                 )
-        if self.__max is not None:
-            if i > self.__max:
-                raise ValueError(f"expected number to be at most {self.__max}")
+        max = self.__get_max()
+        if max is not None:
+            if i > max:
+                raise ValueError(f"expected number to be at most {max}")
         return i
 
 
+class ChoiceParam(Param):
+    """Class to handle parameters with a fixed set of values.
+       Inherits from the class Param."""
+    def __init__(
+        self, name: str, choices: list[str], optional: bool = False
+    ) -> None:
+        self.__name = name
+        self.__choices = choices
+        self.__optional = optional
+
+    def optional(self) -> bool:
+        """Returns if the choice parameter is optional"""
+        return self.__optional
+
+    def name(self) -> str:
+        """Returns the name of the choice parameter"""
+        return self.__name
+
+    def constraints(self) -> str:
+        """Returns the allowed values"""
+        return "|".join(self.__choices)
+
+    def parse(self, val: str) -> str:
+        """Returns the value if allowed, else raises a ValueError"""
+        if val not in self.__choices:
+            raise ValueError(f"expected one of {', '.join(self.__choices)}")
+        return val
+
+
 @dataclass
 class Command:
     """Command is a command that can be executed in the shell.
     The signature for the run callback is inteded as follows:
-    def my_cmd(self, params: list[object]) -> None:"""
+    def my_cmd(self, params: list[object]) -> None:
+    A command which asks for input is a generator instead. It yields
+    each prompt and gets the line entered sent back:
+        answer = yield "Selection [yN]: "
+    so it doesn't block while waiting, see Shell.execute_steps."""
 
     name: str
     description: str
     params: list[Param]
     run: Callable[[object, list[object]], None]
+    aliases: list[str] = field(default_factory=list)
+
+
+def run_steps(steps, read_line: Callable[[str], str]) -> object:
+    """Runs a generator yielding prompts, like a Command or
+    Shell.execute_steps, to its end, answering each prompt with
+    read_line(prompt). Returns the generator's return value."""
+    try:
+        prompt = next(steps)
+        while True:
+            prompt = steps.send(read_line(prompt))
+    except StopIteration as e:
+        return e.value
+    finally:
+        steps.close()
+
+
+@dataclass
+class DispatchPlan:
+    """DispatchPlan is a Command compiled by Shell.add_command, so
+    dispatching a line doesn't need to inspect the parameters."""
+
+    cmd: Command
+    min_params: int
+    max_params: int
+    # Whether the last parameter takes the rest of the line.
+    rest: bool
+    # Parse function and error message prefix for each parameter.
+    parsers: list[tuple[Callable[[str], object], str]]
+    too_few_msg: str
+    too_many_msg: str
+
+
+class CommandTrie:
+    """Prefix tree of command names and aliases. Looks up full words
+    as well as unambiguous prefixes of them. A prefix of several words
+    is still unambiguous if the shortest of them is a prefix of all
+    others, e.g. "ord" for "order" and "orders" means "order"."""
+
+    def __init__(self) -> None:
+        # Each node is [children, word ending here, words below].
+        self.__root = [{}, None, set()]
+        # Command name of each word.
+        self.__names: dict[str, str] = {}
+
+    def insert(self, word: str, name: str) -> None:
+        """Makes word and its prefixes refer to the command name."""
+        self.__names[word] = name
+        node = self.__root
+        node[2].add(word)
+        for c in word:
+            node = node[0].setdefault(c, [{}, None, set()])
+            node[2].add(word)
+        node[1] = word
+
+    def lookup(self, word: str) -> list[str]:
+        """Returns the name of the command word refers to as a single
+        element list. Returns all candidates if word is an ambiguous
+        prefix, or an empty list if nothing matches."""
+        node = self.__root
+        for c in word:
+            node = node[0].get(c)
+            if node is None:
+                return []
+        if node[1] is not None:
+            return [self.__names[node[1]]]
+        names = set(self.__names[w] for w in node[2])
+        if len(names) > 1:
+            shortest = min(node[2], key=len)
+            if all(w.startswith(shortest) for w in node[2]):
+                return [self.__names[shortest]]
+        return sorted(names)
 
 
 class Shell:
@@ -128,6 +259,18 @@ class Shell:
     def __init__(self) -> None:
         self.__prompt_elems: list[str] = []
         self.__commands: dict[str, Command] = {}
+        self.__plans: dict[str, DispatchPlan] = {}
+        self.__trie = CommandTrie()
+        # Remaining script lines and confirmation policy in batch mode.
+        self.__batch_lines = None
+        self.__confirm = "inline"
+        # Command statistics, None while disabled.
+        self.__stats = None
+
+    def enable_stats(self, stats) -> None:
+        """Records latencies and counters of all commands in stats
+        (a stats.Stats) and adds the "stats" command showing them."""
+        self.__stats = stats
 
     def add_command(self, cmd: Command) -> None:
         """Adds a new command to the shell. Raises an
@@ -138,8 +281,49 @@ class Shell:
                 raise ValueError("only the last parameters may be optional")
             if param.optional():
                 seen_optional_param = True
+        if any(p.rest() for p in cmd.params[:-1]):
+            raise ValueError("only the last parameter may take the rest")
 
         self.__commands[cmd.name] = cmd
+        self.__plans[cmd.name] = self.__compile(cmd)
+        for word in [cmd.name] + cmd.aliases:
+            self.__trie.insert(word, cmd.name)
+
+    def command(self, word: str) -> Command:
+        """Returns the command named word, or abbreviated to word as
+        on the command line. Raises a KeyError if there is no such
+        command or word is ambiguous."""
+        names = self.__trie.lookup(word)
+        if len(names) != 1:
+            raise KeyError(word)
+        return self.__commands[names[0]]
+
+    @staticmethod
+    def __compile(cmd: Command) -> DispatchPlan:
+        min_params = sum(0 if p.optional() else 1 for p in cmd.params)
+        max_params = len(cmd.params)
+        plural = "" if min_params == 1 else "s"
+        too_few_msg = (
+            f"{cmd.name} expects at least {min_params} parameter{plural}."
+        )
+        if max_params == 0:
+            too_many_msg = f"{cmd.name} expects no parameters."
+        else:
+            too_many_msg = (
+                f"{cmd.name} expects at most {max_params} parameters."
+            )
+        parsers = [
+            (p.parse, f"Error: {cmd.name}: {p.name()}: ") for p in cmd.params
+        ]
+        return DispatchPlan(
+            cmd,
+            min_params,
+            max_params,
+            max_params > 0 and cmd.params[-1].rest(),
+            parsers,
+            too_few_msg,
+            too_many_msg,
+        )
 
     def help(self) -> str:
         """Print a nicely formatted help page listing
@@ -149,6 +333,8 @@ class Shell:
             ["exit", "exit the shell"],
             ["help", "show this page"],
         ]
+        if self.__stats is not None:
+            rows.append(["stats", "show command latencies and errors"])
 
         for cmd in self.__commands.values():
             words = [cmd.name]
@@ -159,7 +345,10 @@ class Shell:
                 else:
                     word = f"<{word}>"
                 words.append(word)
-            rows.append([" ".join(words), cmd.description])
+            description = cmd.description
+            if len(cmd.aliases) > 0:
+                description += f" (alias: {', '.join(cmd.aliases)})"
+            rows.append([" ".join(words), description])
 
         for row in rows:
             row[0] = "  " + row[0]
@@ -177,6 +366,145 @@ class Shell:
         before each prompt, separated by spaces."""
         self.__prompt_elems = elems
 
+    def read_line(self, prompt: str) -> str:
+        """Reads a line of input for a command, e.g. a confirmation.
+        In batch mode, the line is taken from the script or given by
+        the confirmation policy (see run_batch)."""
+        if self.__batch_lines is None:
+            return input(prompt)
+        if self.__confirm == "yes":
+            return "y"
+        if self.__confirm == "default":
+            return ""
+        line = next(self.__batch_lines, None)
+        if line is None:
+            raise EOFError
+        return line.removesuffix("\n")
+
+    def parse(self, line: str) -> tuple[Command, list[object]]:
+        """Looks up the command of a non-blank line and parses its
+        parameters like execute does, without running it. Raises a KeyError if
+        the command is unknown or ambiguous, or a ValueError if the
+        parameters are invalid, with the message execute prints."""
+        args = line.split()
+        plan = self.__lookup(args[0])
+        return plan.cmd, self.__parse(plan, args)
+
+    def __lookup(self, word: str) -> DispatchPlan:
+        names = self.__trie.lookup(word)
+        if len(names) > 1:
+            raise KeyError(
+                f'Ambiguous command "{word}": {", ".join(names)}.'
+            )
+        if len(names) == 0:
+            raise KeyError(
+                f'Unknwon command "{word}"!\n'
+                'Type "help" for a list of commands.'
+            )
+        return self.__plans[names[0]]
+
+    @staticmethod
+    def __parse(plan: DispatchPlan, args: list[str]) -> list[object]:
+        if plan.rest and len(args) > plan.max_params + 1:
+            # The last parameter takes all remaining words.
+            args[plan.max_params :] = [" ".join(args[plan.max_params :])]
+        num_params = len(args) - 1
+        if num_params < plan.min_params:
+            raise ValueError(plan.too_few_msg)
+        if num_params > plan.max_params:
+            raise ValueError(plan.too_many_msg)
+        params = [None] * plan.max_params
+        for i in range(num_params):
+            parse, error_prefix = plan.parsers[i]
+            try:
+                params[i] = parse(args[i + 1])
+            except Exception as e:
+                raise ValueError(f"{error_prefix}{e}.")
+        return params
+
+    def execute(self, line: str, session: object = None) -> bool:
+        """Executes a single command line. Returns False if the
+        shell should exit. The command callback gets session as self,
+        which defaults to the shell itself. Prompts are answered by
+        its read_line."""
+        return run_steps(
+            self.execute_steps(line, session),
+            (self if session is None else session).read_line,
+        )
+
+    def execute_steps(self, line: str, session: object = None):
+        """Executes a single command line step by step: yields each
+        prompt of the command and expects the answer to be sent back.
+        Returns False if the shell should exit. This lets a server
+        wait for answers without holding a thread."""
+        args = line.split()
+        if len(args) == 0:
+            return True
+        stats = self.__stats
+        if args[0] == "help":
+            print(self.help())
+        elif args[0] == "exit" or args[0] == "quit":
+            print("Exiting.")
+            return False
+        elif args[0] == "stats" and stats is not None:
+            print(stats.format())
+        else:
+            if stats is not None:
+                start = time.perf_counter()
+            try:
+                plan = self.__lookup(args[0])
+            except KeyError as e:
+                print(e.args[0])
+                if stats is not None:
+                    stats.unknown()
+                print()
+                return True
+            try:
+                params = self.__parse(plan, args)
+            except ValueError as e:
+                print(e)
+                if stats is not None:
+                    stats.invalid_params(plan.cmd.name)
+                return True
+            target = self if session is None else session
+            if stats is None:
+                yield from self.__run(plan.cmd, target, params)
+            else:
+                parsed = time.perf_counter()
+                try:
+                    running = yield from self.__run(plan.cmd, target, params)
+                except EOFError:
+                    raise
+                except Exception:
+                    stats.error(plan.cmd.name)
+                    raise
+                stats.observe(plan.cmd.name, parsed - start, running)
+        print()
+        return True
+
+    @staticmethod
+    def __run(cmd: Command, target: object, params: list[object]):
+        """Runs a command, passing its prompts on. Returns the time it
+        ran in seconds, without the time it waited for answers."""
+        start = time.perf_counter()
+        steps = cmd.run(target, params)
+        if not isinstance(steps, types.GeneratorType):
+            return time.perf_counter() - start
+        running = 0.0
+        answer = None
+        try:
+            while True:
+                try:
+                    prompt = steps.send(answer)
+                finally:
+                    running += time.perf_counter() - start
+                answer = yield prompt
+                start = time.perf_counter()
+        except StopIteration:
+            return running
+        finally:
+            steps.close()
+
     def run(self, init_prompt: str) -> None:
         """Runs the main shell loop."""
         print(init_prompt)
@@ -184,61 +512,8 @@ class Shell:
         while True:
             try:
                 prompt = " ".join(self.__prompt_elems + [">> "])
-                args = input(prompt).split()
-                if len(args) == 0:
-                    continue
-                if args[0] == "help":
-                    print(self.help())
-                elif args[0] == "exit" or args[0] == "quit":
-                    print("Exiting.")
+                if not self.execute(input(prompt)):
                     break
-                elif args[0] in self.__commands:
-                    cmd = self.__commands[args[0]]
-                    num_params = len(args) - 1
-                    min_params = sum(
-                        0 if p.optional else 1 for p in cmd.params
-                    )
-                    max_params = len(cmd.params)
-                    if num_params < min_params:
-                        plural = "" if min_params == 1 else "s"
-                        print(f"{args[0]} expects at least \
-{min_params} parameter{plural}.")
-                        continue
-                    if num_params > max_params:
-                        if max_params == 0:
-                            print(
-                                f"{args[0]} expects no \
-parameters."
-                            )
-                        else:
-                            print(
-                                f"{args[0]} expects at most \
-{max_params} parameters."
-                            )
-                        continue
-                    params_not_ok = False
-                    params = []
-                    for i, param in enumerate(cmd.params):
-                        if i + 1 >= len(args):
-                            # Optional param wasn't specified.
-                            params.append(None)
-                            continue
-                        try:
-                            params.append(param.parse(args[i + 1]))
-                        except Exception as e:
-                            print(
-                                f"Error: {cmd.name}: \
-{param.name}: {e}."
-                            )
-                            params_not_ok = True
-                            break
-                    if params_not_ok:
-                        continue
-                    cmd.run(self, params)
-                else:
-                    print(f'Unknwon command "{args[0]}"!')
-                    print('Type "help" for a list of commands.')
-                print()
             except KeyboardInterrupt:
                 print()
                 print('Type "exit" or "quit", or ctrl+d to quit.')
@@ -247,3 +522,47 @@ parameters."
                 print()
                 print("Exiting.")
                 break
+
+    def run_batch(
+        self, file, confirm: str = "inline", flush_every: int = 1000
+    ) -> tuple[int, float]:
+        """Executes the commands in file without prompting, e.g. to
+        replay a recorded session. Blank lines and lines starting with
+        "#" are skipped. Confirmations are answered according to
+        confirm:
+            "inline" -> read from the next line of the file,
+            "yes" -> always answer "y",
+            "default" -> always take the default answer.
+        Output is buffered and written every flush_every commands.
+        Returns the number of commands executed and the time taken
+        in seconds."""
+        if confirm not in ["inline", "yes", "default"]:
+            raise ValueError(f'invalid confirmation policy "{confirm}"')
+        self.__batch_lines = iter(file)
+        self.__confirm = confirm
+        out = sys.stdout
+        buf = io.StringIO()
+        count = 0
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(buf):
+                for line in self.__batch_lines:
+                    if line.strip() == "" or line.lstrip().startswith("#"):
+                        continue
+                    count += 1
+                    try:
+                        if not self.execute(line):
+                            break
+                    except EOFError:
+                        print()
+                        print("Exiting.")
+                        break
+                    if count % flush_every == 0:
+                        out.write(buf.getvalue())
+                        buf.seek(0)
+                        buf.truncate()
+        finally:
+            out.write(buf.getvalue())
+            out.flush()
+            self.__batch_lines = None
+        return count, time.perf_counter() - start
@@ -0,0 +1,219 @@
+__author__ = "8030456, Schuppan, 8404886, Kraus"
+
+from array import array
+import math
+import os
+import threading
+
+from util import Util
+
+
+class Histogram:
+    """Latency histogram using a fixed amount of memory. Bucket i
+    holds durations of up to 2**(i/4) µs, so percentiles are off by
+    at most 19%. The last bucket also holds everything longer."""
+
+    BUCKETS = 128  # Up to about an hour.
+
+    def __init__(self) -> None:
+        self.counts = array("Q", bytes(8 * self.BUCKETS))
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    @staticmethod
+    def upper(i: int) -> float:
+        """Returns the upper bound of bucket i in seconds."""
+        return 2 ** (i / 4) / 1e6
+
+    def observe(self, seconds: float) -> None:
+        """Adds a duration in seconds."""
+        us = seconds * 1e6
+        i = 0
+        if us > 1:
+            i = min(self.BUCKETS - 1, math.ceil(math.log2(us) * 4))
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p: float) -> float:
+        """Returns an upper bound for the p-th quantile (0 < p <= 1)
+        in seconds, or 0 if nothing was observed."""
+        rank = math.ceil(p * self.count)
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n > 0 and seen >= rank:
+                return min(self.upper(i), self.max)
+        return 0.0
+
+
+class Stats:
+    """Per-command latencies of parsing and running commands, and
+    counters of errors, invalid parameters and unknown commands."""
+
+    def __init__(self) -> None:
+        # Shell.execute may run on several threads, see server.py.
+        self.__lock = threading.Lock()
+        self.__parse: dict[str, Histogram] = {}
+        self.__run: dict[str, Histogram] = {}
+        self.__errors: dict[str, int] = {}
+        self.__invalid_params: dict[str, int] = {}
+        self.__unknown = 0
+
+    def observe(self, cmd: str, parse: float, run: float) -> None:
+        """Records the time a command took to parse and to run."""
+        with self.__lock:
+            if cmd not in self.__run:
+                self.__parse[cmd] = Histogram()
+                self.__run[cmd] = Histogram()
+            self.__parse[cmd].observe(parse)
+            self.__run[cmd].observe(run)
+
+    def error(self, cmd: str) -> None:
+        """Counts a command which raised an exception."""
+        with self.__lock:
+            self.__errors[cmd] = self.__errors.get(cmd, 0) + 1
+
+    def invalid_params(self, cmd: str) -> None:
+        """Counts a command rejected because of its parameters."""
+        with self.__lock:
+            self.__invalid_params[cmd] = self.__invalid_params.get(cmd, 0) + 1
+
+    def unknown(self) -> None:
+        """Counts an unknown or ambiguous command."""
+        with self.__lock:
+            self.__unknown += 1
+
+    def format(self) -> str:
+        """Returns a table of call counts, latency percentiles and
+        counters per command."""
+
+        def ms(seconds: float) -> str:
+            return f"{seconds * 1000:.3f}"
+
+        with self.__lock:
+            names = sorted(
+                self.__run.keys()
+                | self.__errors.keys()
+                | self.__invalid_params.keys()
+            )
+            rows = [
+                [
+                    "Command",
+                    "Calls",
+                    "Parse p50",
+                    "Run p50",
+                    "p95",
+                    "p99",
+                    "Errors",
+                    "Invalid",
+                ]
+            ]
+            for name in names:
+                run = self.__run.get(name, Histogram())
+                rows.append(
+                    [
+                        name,
+                        str(run.count),
+                        ms(self.__parse.get(name, run).percentile(0.5)),
+                        ms(run.percentile(0.5)),
+                        ms(run.percentile(0.95)),
+                        ms(run.percentile(0.99)),
+                        str(self.__errors.get(name, 0)),
+                        str(self.__invalid_params.get(name, 0)),
+                    ]
+                )
+            unknown = self.__unknown
+        return (
+            Util.column_align(rows, sep="  ")
+            + "\nTimes in ms."
+            + f"\nUnknown commands: {unknown}"
+        )
+
+    def prometheus(self) -> str:
+        """Returns all statistics in the Prometheus text format."""
+        lines = []
+
+        def histograms(metric: str, help: str, hists: dict) -> None:
+            lines.append(f"# HELP {metric} {help}")
+            lines.append(f"# TYPE {metric} histogram")
+            for name, h in sorted(hists.items()):
+                label = f'command="{name}"'
+                seen = 0
+                # Scrapers expect the same buckets every time. The last
+                # one also holds longer durations, so it is only +Inf.
+                for i in range(h.BUCKETS - 1):
+                    seen += h.counts[i]
+                    lines.append(
+                        f'{metric}_bucket{{{label},le="{h.upper(i):g}"}} '
+                        f"{seen}"
+                    )
+                lines.append(f'{metric}_bucket{{{label},le="+Inf"}} {h.count}')
+                lines.append(f"{metric}_sum{{{label}}} {h.sum:g}")
+                lines.append(f"{metric}_count{{{label}}} {h.count}")
+
+        def counters(metric: str, help: str, counts: dict) -> None:
+            lines.append(f"# HELP {metric} {help}")
+            lines.append(f"# TYPE {metric} counter")
+            for name, n in sorted(counts.items()):
+                lines.append(f'{metric}{{command="{name}"}} {n}')
+
+        with self.__lock:
+            histograms(
+                "shell_parse_seconds",
+                "Time spent parsing command parameters.",
+                self.__parse,
+            )
+            histograms(
+                "shell_run_seconds",
+                "Time spent running commands.",
+                self.__run,
+            )
+            counters(
+                "shell_errors_total",
+                "Commands which raised an exception.",
+                self.__errors,
+            )
+            counters(
+                "shell_invalid_params_total",
+                "Commands rejected because of their parameters.",
+                self.__invalid_params,
+            )
+            lines.append("# HELP shell_unknown_total Unknown commands.")
+            lines.append("# TYPE shell_unknown_total counter")
+            lines.append(f"shell_unknown_total {self.__unknown}")
+        return "\n".join(lines) + "\n"
+
+
+class StatsDumper:
+    """Writes the statistics in the Prometheus text format to a file
+    every interval seconds and once more on close(). The file is
+    replaced atomically, so readers never see a partial dump."""
+
+    def __init__(self, stats: Stats, filename: str, interval: float = 10):
+        self.__stats = stats
+        self.__filename = filename
+        self.__interval = interval
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.__loop, daemon=True)
+        self.__thread.start()
+
+    def dump(self) -> None:
+        """Writes the statistics now."""
+        tmp = self.__filename + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(self.__stats.prometheus())
+        os.replace(tmp, self.__filename)
+
+    def close(self) -> None:
+        """Stops the background thread and writes a final dump."""
+        self.__stop.set()
+        self.__thread.join()
+        self.dump()
+
+    def __loop(self) -> None:
+        while not self.__stop.wait(self.__interval):
+            self.dump()
@@ -1,5 +1,8 @@
 __author__ = "8030456, Schuppan, 8404886, Kraus"
 
+import shutil
+import sys
+
 
 class Util:
     """This has no reason to be a class."""
@@ -9,49 +12,135 @@ class Util:
     ) -> str:
         """Column-aligns all cells in the given list.
 
-        >>> print(column_align([["a", "abc"], ["abc", "a"]]))
+        >>> print(Util.column_align([["a", "abc"], ["abc", "a"]]))
         a   abc
         abc a
-        >>> print(column_align([["a", "abc"], ["abc", "a"], ["abcd"]]))
+        >>> print(Util.column_align([["a", "abc"], ["abc", "a"], ["abcd"]]))
         a    abc
         abc  a
         abcd
-        >>> print(column_align([["a", "ab", "a"], ["a", "a"], ["a"] * 4]))
+        >>> print(Util.column_align([["a", "ab", "a"], ["a", "a"], ["a"] * 4]))
         a ab a
         a a
         a a  a a
-        >>> print(column_align([["a", "abc"], ["abc", "a"]], sep="_", pad="."))
+        >>> rows = [["a", "abc"], ["abc", "a"]]
+        >>> print(Util.column_align(rows, sep="_", pad="."))
         a.._abc
         abc_a
         """
-        # Number of cells of the row with the most cells.
-        max_cols = max(len(row) for row in rows)
-        # Length of the largest cell in each column.
-        max_col_widths = [
-            # For each set of cells in a column, get the length of the largest
-            # cell.
-            max(
-                len(rows[row_idx][col_idx])
-                if col_idx < len(rows[row_idx])
-                else 0
-                for row_idx in range(len(rows))
-            )
-            for col_idx in range(max_cols)
-        ]
-        return "\n".join(
-            sep.join(
+        return "\n".join(Util.column_align_lines(rows, sep=sep, pad=pad))
+
+    def column_align_lines(
+        rows,
+        sep: str = " ",
+        pad: str = " ",
+        widths: list[int] | None = None,
+        max_widths: list[int | None] | None = None,
+    ):
+        """Yields the column-aligned lines of rows one by one.
+
+        Without widths, the column widths are computed in a single
+        pass over rows first. With widths given, rows may be any
+        iterable and is consumed lazily, so the first line is ready
+        right away. Cells longer than their column's max_widths
+        entry are cut off and end in "...".
+
+        >>> for line in Util.column_align_lines(
+        ...     iter([["a", "abcdef", "x"], ["ab", "a", "y"]]),
+        ...     widths=[2, 6],
+        ...     max_widths=[None, 4],
+        ... ):
+        ...     print(line)
+        a  a... x
+        ab a    y
+        """
+        if widths is None:
+            rows = list(rows)
+            # Length of the largest cell in each column.
+            widths = []
+            for row in rows:
+                for col_idx, cell in enumerate(row):
+                    if col_idx == len(widths):
+                        widths.append(len(cell))
+                    elif len(cell) > widths[col_idx]:
+                        widths[col_idx] = len(cell)
+        if max_widths is not None:
+            widths = [
+                (
+                    w
+                    if i >= len(max_widths) or max_widths[i] is None
+                    else min(w, max_widths[i])
+                )
+                for i, w in enumerate(widths)
+            ]
+        for row in rows:
+            cells = []
+            for col_idx, cell in enumerate(row):
+                if (
+                    max_widths is not None
+                    and col_idx < len(max_widths)
+                    and max_widths[col_idx] is not None
+                    and len(cell) > max_widths[col_idx]
+                ):
+                    cell = cell[: max(max_widths[col_idx] - 3, 0)] + "..."
+                    cell = cell[: max_widths[col_idx]]
                 # Pad each cell so it aligns with all other
                 # cells in that column.
-                cell
-                + (
-                    pad
-                    * (
-                        max_col_widths[col_idx] - len(cell)
-                        if col_idx < len(row) - 1
-                        else 0
-                    )
-                )
-                for col_idx, cell in enumerate(row)
-            )
-            for row in rows
-        )
+                if col_idx < len(row) - 1 and col_idx < len(widths):
+                    cell += pad * (widths[col_idx] - len(cell))
+                cells.append(cell)
+            yield sep.join(cells)
+
+    def page(lines, height: int | None = None):
+        """Prints lines, pausing after each screenful if the output is
+        a terminal. height defaults to the terminal's height. Yields
+        the pager's prompt and expects the answer to be sent back, so
+        commands call it with "yield from", see shell.Command."""
+        if not sys.stdout.isatty():
+            for line in lines:
+                print(line)
+            return
+        if height is None:
+            height = shutil.get_terminal_size().lines
+        # Leave at least one line per page besides the prompt.
+        height = max(height, 2)
+        for i, line in enumerate(lines):
+            if i > 0 and i % (height - 1) == 0:
+                sel = yield "-- More -- [Enter: next page, q: quit] "
+                if sel.lower() == "q":
+                    return
+            print(line)
+
+    def parse_cents(val: str) -> int:
+        """Parses a decimal amount like "12", "12,5" or "3.50" into
+        cents without going through a float. Raises a ValueError if
+        the amount is malformed or more precise than a cent.
+
+        >>> Util.parse_cents("12,5")
+        1250
+        >>> Util.parse_cents("0.07")
+        7
+        """
+        whole, _, frac = val.strip().replace(",", ".").partition(".")
+        if (
+            not (whole.isdigit() or (whole == "" and frac != ""))
+            or not (frac == "" or frac.isdigit())
+            or not whole.isascii()
+            or not frac.isascii()
+        ):
+            raise ValueError("expected a decimal number")
+        frac = frac.rstrip("0")
+        if len(frac) > 2:
+            raise ValueError("expected at most 2 decimal places")
+        return int(whole or "0") * 100 + int(frac.ljust(2, "0"))
+
+    def format_cents(cents: int) -> str:
+        """Formats an amount in cents exactly, with two decimal places.
+
+        >>> Util.format_cents(1250)
+        '12.50'
+        >>> Util.format_cents(-5)
+        '-0.05'
+        """
+        sign = "-" if cents < 0 else ""
+        return f"{sign}{abs(cents) // 100}.{abs(cents) % 100:02d}"